@@ -5,8 +5,14 @@ from os import listdir
 from discord.ext import commands
 
 import helpers.database as db
+import helpers.http as http
+import reddit.client as reddit_client
+import reddit.media as media
+from reddit.index import SUBSCRIPTIONS
 from helpers.logger import Logger, Priority
-from helpers.env import DEBUG_GUILDS, TOKEN, shutdown_db
+from helpers.dispatcher import MessageDispatcher
+from helpers.scheduler import DailyScheduler
+from helpers.env import DEBUG_GUILDS, TOKEN, LOG_FILE, shutdown_db
 
 
 intents = discord.Intents(messages=True, message_content=True,
@@ -14,13 +20,35 @@ intents = discord.Intents(messages=True, message_content=True,
 
 debugs = DEBUG_GUILDS.split('|') if DEBUG_GUILDS else None
 
-bot = commands.Bot(intents=intents, command_prefix='%s',
-                   activity=discord.Game(name="/help"),
-                   debug_guilds=debugs)
+
+class NixBot(commands.Bot):
+    setup_done = False  # one-time setup in on_ready has run
+
+    async def close(self) -> None:
+        """
+        Lets cogs that hold unflushed state or open resources clean up before disconnecting
+        """
+        for cog in list(self.cogs.values()):
+            close = getattr(cog, "close", None)
+            if close is not None:
+                await close()
+        await scheduler.stop()
+        await reddit_client.close_reddit()
+        media.shutdown()
+        await http.close_session()
+        await super().close()
+
+
+bot = NixBot(intents=intents, command_prefix='%s',
+             activity=discord.Game(name="/help"),
+             debug_guilds=debugs)
 
 
 logger = Logger()
 logger.set_bot(bot)
+dispatcher = MessageDispatcher()
+dispatcher.set_bot(bot)
+scheduler = DailyScheduler()
 
 
 @bot.event
@@ -31,7 +59,7 @@ async def on_guild_join(guild: discord.Guild) -> None:
     Args:
         guild (discord.Guild): Guild that triggered the event
     """
-    db.single_void_SQL(
+    await db.execute(
         "INSERT INTO Guilds (ID, CountingChannelID, BirthdayChannelID, " +
         "FactChannelID, CurrentCount, LastCounterID, HighScoreCounting, FailRoleID)" +
         " VALUES (%s, NULL, NULL, NULL, 0, NULL, 0, NULL);", (guild.id,))
@@ -45,14 +73,17 @@ async def on_guild_remove(guild: discord.Guild) -> None:
     Args:
         guild (discord.Guild): Guild that triggered the event
     """
-    db.multi_void_sql([
+    await db.transaction([
         ("DELETE FROM Birthdays WHERE GuildID=%s", (guild.id,)),
         ("DELETE FROM Subreddits WHERE GuildID=%s", (guild.id,)),
         ("DELETE FROM ChainedUsers WHERE GuildID=%s", (guild.id,)),
         ("DELETE FROM MessageChain WHERE GuildID=%s", (guild.id,)),
         ("DELETE FROM RoleChannel WHERE GuildID=%s", (guild.id,)),
         ("DELETE FROM ReactMessages WHERE GuildID=%s", (guild.id,)),
+        ("DELETE FROM JobRuns WHERE GuildID=%s", (guild.id,)),
         ("DELETE FROM Guilds WHERE ID=%s", (guild.id,))])
+    dispatcher.forget_guild(guild.id)
+    SUBSCRIPTIONS.forget_guild(guild.id)
 
 
 @bot.event
@@ -63,14 +94,18 @@ async def on_guild_channel_delete(channel: discord.TextChannel) -> None:
     Args:
         channel (discord.Channel): Channel that triggered the event
     """
-    db.multi_void_sql([
-        ("DELETE FROM Subreddits WHERE SubredditChannelID=%s", (channel.id,)),
-        ("DELETE FROM ChainedUsers WHERE ChannelID=%s", (channel.id,)),
-        (
-            "DELETE FROM MessageChain WHERE ChannelID=%s OR ResponseChannelID=%s",
-            (channel.id, channel.id)
-        ),
-        ("DELETE FROM RoleChannel WHERE ChannelID=%s", (channel.id,))])
+    try:
+        await db.transaction([
+            ("DELETE FROM Subreddits WHERE SubredditChannelID=%s", (channel.id,)),
+            ("DELETE FROM ChainedUsers WHERE ChannelID=%s", (channel.id,)),
+            (
+                "DELETE FROM MessageChain WHERE WatchedChannelID=%s OR ResponseChannelID=%s",
+                (channel.id, channel.id)
+            ),
+            ("DELETE FROM RoleChannel WHERE ChannelID=%s", (channel.id,))])
+    finally:
+        dispatcher.forget_channel(channel.id)
+        SUBSCRIPTIONS.forget_channel(channel.guild.id, channel.id)
 
 
 @bot.event
@@ -81,31 +116,46 @@ async def on_member_remove(member: discord.Member) -> None:
     Args:
         member (discord.Member): Member that triggered the event
     """
-    db.multi_void_sql([
+    await db.transaction([
         ("DELETE FROM Birthdays WHERE GuildID=%s AND UserID=%s", (member.guild.id, member.id)),
         ("DELETE FROM ChainedUsers WHERE GuildID=%s AND UserID=%s", (member.guild.id, member.id))])
 
 
 @bot.event
 async def on_ready() -> None:
+    """
+    Called when Nix connects, and again after every reconnect. Setup is only done once
+    """
+    if not bot.setup_done:
+        await db.warmup()
+        await dispatcher.build()
+        scheduler.start()
+        bot.setup_done = True
     if bot.user is not None:
         logger.info('Logged in', member_id=bot.user.id)
 
 
 def main() -> None:
     priority = None
+    log_file = LOG_FILE
     test_req = False
     test_env = False
 
-    opts, _ = getopt.getopt(sys.argv[1:], "iel:", ["logger-level=", "test-deps", "test_env"])
+    opts, _ = getopt.getopt(sys.argv[1:], "iel:f:",
+                            ["logger-level=", "log-file=", "test-deps", "test_env"])
     for opt, arg in opts:
         if opt in ["-l", "--logger-level"]:
             priority = Priority[arg.upper()].name
+        if opt in ["-f", "--log-file"]:
+            log_file = arg
         if opt in ["-i", "--test-deps"]:
             test_req = True
         if opt in ["-e", "--test-env"]:
             test_env = True
 
+    if log_file:
+        logger.set_output(log_file)
+
     if priority:
         logger.set_priority(priority)
     else:
@@ -126,6 +176,8 @@ def main() -> None:
                     exit_code = 1
             exit(exit_code)
 
+    db.migrate()
+
     cogs = [cog[: -3] for cog in listdir('./src/cogs')
             if cog[-3:] == ".py" and (cog not in ["__init__.py", "debug.py"])]
     for cog in cogs:
@@ -140,8 +192,10 @@ def main() -> None:
     except KeyboardInterrupt:
         logger.warning("Keyboard interrupt: Failed to shutdown")
     finally:
+        db.close()
         shutdown_db()
         logger.info("Bot succesfully shutdown")
+        logger.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,78 @@
+import calendar
+import datetime as dt
+
+import helpers.database as db
+
+MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+MAX_RANGE = 366  # days an upcoming birthdays query may span
+
+
+def celebrated_on(month: int, day: int, year: int) -> dt.date:
+    """Get the date a birthday is celebrated on in a given year
+
+    Birthdays on the 29th of February are celebrated on the 28th in non-leap years
+
+    Args:
+        month (int): Month of the birthday
+        day (int): Day of the birthday
+        year (int): Year to celebrate in
+
+    Returns:
+        dt.date: Date of the celebration
+    """
+    if month == 2 and day == 29 and not calendar.isleap(year):
+        day = 28
+    return dt.date(year, month, day)
+
+
+def birthdays_on(day: dt.date) -> tuple[int, list[int]]:
+    """Get the birthdays celebrated on a date
+
+    Args:
+        day (dt.date): Date of the celebration
+
+    Returns:
+        tuple[int, list[int]]: Month, and the days of that month whose birthdays are celebrated
+    """
+    if day.month == 2 and day.day == 28 and not calendar.isleap(day.year):
+        return (2, [28, 29])
+    return (day.month, [day.day])
+
+
+def _month_day(day: dt.date) -> tuple[int, int]:
+    """Month and day of a date, widened to cover Feb 29 when it ends a non-leap February"""
+    if day.month == 2 and day.day == 28 and not calendar.isleap(day.year):
+        return (2, 29)
+    return (day.month, day.day)
+
+
+async def upcoming(guild_id: int, start: dt.date, days: int) -> list[tuple[dt.date, int]]:
+    """Get the birthdays of a guild celebrated in a range of days
+
+    Uses the (GuildID, BirthMonth, BirthDay) index, with one range per calendar year covered
+
+    Args:
+        guild_id (int): ID of the guild
+        start (dt.date): First day of the range
+        days (int): Number of days in the range (at most MAX_RANGE)
+
+    Returns:
+        list[tuple[dt.date, int]]: (date celebrated, user ID) pairs, soonest first
+    """
+    days = max(1, min(days, MAX_RANGE))
+    end = start + dt.timedelta(days=days - 1)
+    ranges = [(start, min(end, dt.date(start.year, 12, 31)))]
+    if end.year != start.year:
+        ranges.append((dt.date(end.year, 1, 1), end))
+
+    found: list[tuple[dt.date, int]] = []
+    for (first, last) in ranges:
+        rows = await db.fetch(
+            "SELECT UserID, BirthMonth, BirthDay FROM Birthdays WHERE GuildID=%s AND " +
+            "(BirthMonth, BirthDay) BETWEEN (%s, %s) AND (%s, %s)",
+            (guild_id, first.month, first.day, *_month_day(last)))
+        for (user_id, month, day) in rows:
+            celebration = celebrated_on(month, day, first.year)
+            if first <= celebration <= last:
+                found.append((celebration, user_id))
+    return sorted(found)
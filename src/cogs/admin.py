@@ -1,16 +1,132 @@
 import discord
 from discord.ext import commands
+from discord.partial_emoji import PartialEmoji
 
 from helpers.logger import Logger
 import helpers.database as db
 from helpers.style import Emotes
 from helpers.emoji import Emoji
+from helpers.resolver import Resolver
+from helpers.roles import RoleQueue
+from helpers.scheduler import get_zone
+from helpers.dispatcher import MessageDispatcher, Feature, ALL_CHANNELS
 logger = Logger()
+dispatcher = MessageDispatcher()
+
+
+class ReactRoleIndex:
+    """In-memory copy of ReactMessages with the emoji already parsed
+
+    Maps each watched message ID to its guild and its (emoji, role ID) pairs
+    """
+
+    def __init__(self) -> None:
+        self._messages: dict[int, tuple[int, list[tuple[PartialEmoji, int]]]] = {}
+
+    async def load(self) -> None:
+        """Rebuild the index from the database"""
+        messages: dict[int, tuple[int, list[tuple[PartialEmoji, int]]]] = {}
+        for (guild_id, message_id, role_id, emoji) in await db.fetch(
+                "SELECT GuildID, MessageID, RoleID, Emoji FROM ReactMessages"):
+            try:
+                partial = Emoji(emoji).to_partial_emoji()
+            except ValueError:
+                logger.warning(f"Stored react emoji {emoji} is not valid", guild_id=guild_id)
+                continue
+            messages.setdefault(message_id, (guild_id, []))[1].append((partial, role_id))
+        self._messages = messages
+        logger.info(f"Loaded react roles for {len(messages)} messages")
+
+    def add(self, guild_id: int, message_id: int, emoji: PartialEmoji, role_id: int) -> None:
+        """Watch a message for reactions
+
+        Args:
+            guild_id (int): ID of the guild of the message
+            message_id (int): ID of the message
+            emoji (PartialEmoji): Emoji that assigns the role
+            role_id (int): ID of the role to assign
+        """
+        self._messages.setdefault(message_id, (guild_id, []))[1].append((emoji, role_id))
+
+    def roles_for(self, message_id: int, emoji: PartialEmoji) -> list[int]:
+        """Get the roles assigned by reacting to a message with an emoji
+
+        Args:
+            message_id (int): ID of the message
+            emoji (PartialEmoji): Emoji of the reaction
+
+        Returns:
+            list[int]: IDs of the roles (empty if the message is not watched)
+        """
+        entry = self._messages.get(message_id)
+        if entry is None:
+            return []
+        return [role_id for (partial, role_id) in entry[1] if partial == emoji]
+
+    def remove_role(self, guild_id: int, role_id: int) -> None:
+        """Stop assigning a role from any message in a guild
+
+        Args:
+            guild_id (int): ID of the guild
+            role_id (int): ID of the role
+        """
+        for message_id, (guild, pairs) in list(self._messages.items()):
+            if guild == guild_id:
+                pairs[:] = [pair for pair in pairs if pair[1] != role_id]
+                if not pairs:
+                    del self._messages[message_id]
+
+    def forget_guild(self, guild_id: int) -> None:
+        """Stop watching every message in a guild
+
+        Args:
+            guild_id (int): ID of the guild
+        """
+        self._messages = {message_id: entry for message_id, entry in self._messages.items()
+                          if entry[0] != guild_id}
 
 
 class Admin(commands.Cog):
     def __init__(self, bot: discord.Bot) -> None:
         self.bot = bot
+        self.react_roles = ReactRoleIndex()
+        self.resolver = Resolver(bot)
+        self.role_queue = RoleQueue()
+        dispatcher.register(Feature.CHAIN, self.chain_message, self.chain_channels)
+        dispatcher.register(Feature.ROLE_CHANNEL, self.assign_role, self.role_channels)
+
+    @staticmethod
+    async def chain_channels() -> list[tuple[int, int]]:
+        """Get every channel watched for chain messages
+
+        Returns:
+            list[tuple[int, int]]: (guild ID, channel ID) pairs, channel ID is ALL_CHANNELS
+                for chain messages that watch the whole guild
+        """
+        return [(guild_id, channel_id) for (guild_id, channel_id) in await db.fetch(
+            "SELECT GuildID, WatchedChannelID FROM MessageChain")]
+
+    @staticmethod
+    async def role_channels() -> list[tuple[int, int]]:
+        """Get every role channel
+
+        Returns:
+            list[tuple[int, int]]: (guild ID, channel ID) pairs
+        """
+        return [(guild_id, channel_id) for (guild_id, channel_id) in await db.fetch(
+            "SELECT DISTINCT GuildID, ChannelID FROM RoleChannel")]
+
+    async def close(self) -> None:
+        """Apply queued role changes before shutdown"""
+        await self.role_queue.drain()
+
+    @commands.Cog.listener('on_ready')
+    async def load_react_roles(self) -> None:
+        await self.react_roles.load()
+
+    @commands.Cog.listener('on_guild_remove')
+    async def forget_react_roles(self, guild: discord.Guild) -> None:
+        self.react_roles.forget_guild(guild.id)
 
     @commands.slash_command(
         name="send_react_message",
@@ -55,14 +171,16 @@ class Admin(commands.Cog):
             await ctx.respond(f"Message Sent! {Emotes.HEART}", ephemeral=True)
             return
 
-        await message.add_reaction(emoji=true_emoji.to_partial_emoji())
+        partial_emoji = true_emoji.to_partial_emoji()
+        await message.add_reaction(emoji=partial_emoji)
         logger.debug(f"role={role}")
-        if role:
+        if role and ctx.guild_id is not None:
             logger.debug(f"Message ID on insert: {message.id}")
-            db.single_void_SQL(
+            await db.execute(
                 "INSERT INTO ReactMessages VALUES (%s, %s, %s, %s)",
                 (ctx.guild_id, message.id, role.id, true_emoji.as_text())
             )
+            self.react_roles.add(ctx.guild_id, message.id, partial_emoji, role.id)
         await ctx.respond(f"Message Sent! {Emotes.HEART}")
 
     @discord.slash_command(name="remove_single_role_assignment",
@@ -71,9 +189,12 @@ class Admin(commands.Cog):
     @discord.commands.option("role", type=discord.Role,
                              description="The role to remove assignment for")
     async def remove_single_role(self, ctx: discord.ApplicationContext, role: discord.Role) -> None:
-        db.multi_void_sql([
+        await db.transaction([
             ("DELETE FROM RoleChannel WHERE GuildID=%s AND RoleID=%s", (ctx.guild_id, role.id)),
             ("DELETE FROM ReactMessages WHERE GuildID=%s AND RoleID=%s", (ctx.guild_id, role.id))])
+        await dispatcher.refresh(Feature.ROLE_CHANNEL)
+        if ctx.guild_id is not None:
+            self.react_roles.remove_role(ctx.guild_id, role.id)
         await ctx.respond(f"All role assign behaviours have been cleared for {role.name}")
 
     @discord.slash_command(name="clear_role_setting",
@@ -82,10 +203,13 @@ class Admin(commands.Cog):
     @discord.commands.default_permissions(manage_guild=True)
     async def delete_react_entry(self, ctx: discord.ApplicationContext) -> None:
         logger.info("Dropping react entries", guild_id=ctx.guild_id)
-        db.multi_void_sql([
+        await db.transaction([
             ("DELETE FROM ReactMessages WHERE GuildID=%s", (ctx.guild_id,)),
             ("DELETE FROM RoleChannel WHERE GuildID=%s", (ctx.guild_id,))
         ])
+        await dispatcher.refresh(Feature.ROLE_CHANNEL)
+        if ctx.guild_id is not None:
+            self.react_roles.forget_guild(ctx.guild_id)
         await ctx.respond("All role assign behaviours have been cleared")
 
     @discord.slash_command(name='set_role_channel',
@@ -98,9 +222,10 @@ class Admin(commands.Cog):
         channel: discord.TextChannel,
         role: discord.Role
     ) -> None:
-        db.single_void_SQL(
+        await db.execute(
             "INSERT INTO RoleChannel VALUES (%s, %s, %s, TRUE)",
             (ctx.guild_id, role.id, channel.id))
+        await dispatcher.refresh(Feature.ROLE_CHANNEL)
         await ctx.respond(f"Role channel was set to {channel.mention}")
 
     @discord.slash_command(name='set_remove_role_channel',
@@ -113,9 +238,10 @@ class Admin(commands.Cog):
         channel: discord.TextChannel,
         role: discord.Role
     ) -> None:
-        db.single_void_SQL(
+        await db.execute(
             "INSERT INTO RoleChannel VALUES (%s, %s, %s, FALSE)",
             (ctx.guild_id, role.id, channel.id))
+        await dispatcher.refresh(Feature.ROLE_CHANNEL)
         await ctx.respond(f"Role remove channel was set to {channel.mention}")
 
     @discord.commands.slash_command(
@@ -137,12 +263,13 @@ class Admin(commands.Cog):
         response_channel: discord.TextChannel,
         message_channel: discord.TextChannel
     ) -> None:
-        channel_id = message_channel.id if message_channel is not None else -1
+        channel_id = message_channel.id if message_channel is not None else ALL_CHANNELS
         try:
-            db.single_void_SQL(
+            await db.execute(
                 "INSERT INTO MessageChain VALUES (%s,%s,%s,%s)",
                 (ctx.guild_id, channel_id, response_channel.id, message)
             )
+            await dispatcher.refresh(Feature.CHAIN)
             await ctx.respond(f"You set a chain_message for the channel {response_channel}")
         except db.KeyViolation:
             await ctx.respond(
@@ -153,12 +280,36 @@ class Admin(commands.Cog):
                             description="Clears all chain message behaviours")
     @discord.commands.default_permissions(manage_guild=True)
     async def clear_chain_message(self, ctx: discord.ApplicationContext) -> None:
-        db.multi_void_sql([
+        await db.transaction([
             ("DELETE FROM ChainedUsers WHERE GuildID=%s", (ctx.guild_id,)),
             ("DELETE FROM MessageChain WHERE GuildID=%s", (ctx.guild_id,))
         ])
+        await dispatcher.refresh(Feature.CHAIN)
+
+    @commands.slash_command(name="set_daily_time",
+                            description="Sets when daily birthdays, facts and posts are sent")
+    @discord.commands.option("hour", type=int, min_value=0, max_value=23, required=True)
+    @discord.commands.option("minute", type=int, min_value=0, max_value=59, default=0)
+    @discord.commands.option("timezone", type=str, default="UTC",
+                             description="IANA time zone name (i.e. Europe/London)")
+    @discord.commands.default_permissions(manage_guild=True)
+    async def set_daily_time(
+        self,
+        ctx: discord.ApplicationContext,
+        hour: int,
+        minute: int,
+        timezone: str
+    ) -> None:
+        if get_zone(timezone) is None:
+            await ctx.respond(f"Sorry, I don't know the time zone '{timezone}' {Emotes.CONFUSED}",
+                              ephemeral=True)
+            return
+        await db.execute("UPDATE Guilds SET DeliveryTime=%s, TimeZone=%s WHERE ID=%s",
+                         (hour * 60 + minute, timezone, ctx.guild_id))
+        await ctx.respond(f"Daily messages will be sent at {hour:02}:{minute:02} ({timezone}) " +
+                          f"{Emotes.SUNGLASSES}", ephemeral=True)
+        logger.info("Daily time set", guild_id=ctx.guild_id)
 
-    @commands.Cog.listener('on_message')
     async def chain_message(self, msg: discord.Message) -> None:
         if isinstance(msg.channel, discord.abc.PrivateChannel):
             logger.info("chain_message activated in Private channel")
@@ -170,16 +321,16 @@ class Admin(commands.Cog):
             logger.error("Bot is offline", channel_id=msg.channel.id)
             return
         if msg.author.id != self.bot.user.id:
-            values = db.single_sql(
+            values = await db.fetch(
                 "SELECT WatchedChannelID FROM MessageChain WHERE GuildID=%s", (msg.guild.id,))
             if values is not None:
                 check_vals = [val[0] for val in values]
-                if msg.channel.id in check_vals or -1 in check_vals:
+                if msg.channel.id in check_vals or ALL_CHANNELS in check_vals:
                     try:
-                        db.single_void_SQL(
+                        await db.execute(
                             "INSERT INTO ChainedUsers VALUES (%s, %s, %s)",
                             (msg.guild.id, msg.author.id, msg.channel.id
-                             if msg.channel.id in check_vals else -1))
+                             if msg.channel.id in check_vals else ALL_CHANNELS))
                         await self.send_chained_message(msg.guild, msg.author)
                     except db.KeyViolation:
                         logger.info(
@@ -187,7 +338,6 @@ class Admin(commands.Cog):
                             member_id=msg.author.id, guild_id=msg.guild.id
                         )
 
-    @commands.Cog.listener('on_message')
     async def assign_role(self, msg: discord.Message) -> None:
         if isinstance(msg.channel, discord.abc.PrivateChannel):
             logger.info("assign_role activated in Private channel")
@@ -202,20 +352,23 @@ class Admin(commands.Cog):
             logger.info("Author is not member (likely: user not in guild)")
             return
         if msg.author.id != self.bot.user.id:
-            vals = db.single_sql(
+            vals = await db.fetch(
                 "SELECT RoleID, ToAdd FROM RoleChannel WHERE ChannelID=%s", (msg.channel.id,))
             for (role_id, add_role) in vals:
                 role = msg.guild.get_role(role_id)
                 if role:
                     if add_role:
-                        await msg.author.add_roles(role)
+                        self.role_queue.add(msg.author, role)
                     else:
-                        await msg.author.remove_roles(role)
+                        self.role_queue.remove(msg.author, role)
                 else:
                     logger.error("Couldnt get role for msg role (un)assign")
 
     @commands.Cog.listener('on_raw_reaction_add')
     async def assign_react_role(self, event: discord.RawReactionActionEvent) -> None:
+        role_ids = self.react_roles.roles_for(event.message_id, event.emoji)
+        if not role_ids:
+            return
         if self.bot.user is None:
             logger.error("Bot is offline")
             return
@@ -225,43 +378,46 @@ class Admin(commands.Cog):
             logger.info("reaction event has no member (likely: user not in guild)")
             return
         logger.debug(f"Message ID on reaction: {event.message_id}")
-        vals = db.single_sql(
-            "SELECT Emoji, RoleID FROM ReactMessages WHERE MessageID=%s", (event.message_id,))
-        logger.debug(f"SQL values: {vals}")
-        for (emoji, role_id) in vals:
-            if Emoji(emoji).to_partial_emoji() == event.emoji:
-                logger.debug("adding role")
-                role = event.member.guild.get_role(role_id)
-                if role:
-                    await event.member.add_roles(role)
-                else:
-                    logger.error("Couldnt get role for react role assign")
+        for role_id in role_ids:
+            logger.debug("adding role")
+            role = event.member.guild.get_role(role_id)
+            if role:
+                self.role_queue.add(event.member, role)
+            else:
+                logger.error("Couldnt get role for react role assign")
 
     @commands.Cog.listener('on_raw_reaction_remove')
     async def unassign_react_role(self, event: discord.RawReactionActionEvent) -> None:
+        role_ids = self.react_roles.roles_for(event.message_id, event.emoji)
+        if not role_ids:
+            return
         if event.guild_id is None:
             logger.info("unassign_react_role detected outside of guild",
                         channel_id=event.channel_id)
             return
-        vals = db.single_sql(
-            "SELECT Emoji, RoleID FROM ReactMessages WHERE MessageID=%s", (event.message_id,))
-        for (emoji, role_id) in vals:
-            if Emoji(emoji).to_partial_emoji() == event.emoji:
-                logger.debug("removing role")
-                guild = await self.bot.fetch_guild(event.guild_id)
-                member = await guild.fetch_member(event.user_id)
-                role = guild.get_role(role_id)
-                if role:
-                    await member.remove_roles(role)
-                else:
-                    logger.error("Couldnt get role for react role unassign")
+        rest_before = self.resolver.rest_requests
+        guild = await self.resolver.get_guild(event.guild_id)
+        member = await self.resolver.get_member(guild, event.user_id) if guild else None
+        logger.debug(f"Resolving reaction remover took {self.resolver.rest_requests - rest_before}"
+                     " REST requests")
+        if guild is None or member is None:
+            logger.info("Could not resolve member for react role unassign",
+                        guild_id=event.guild_id)
+            return
+        for role_id in role_ids:
+            logger.debug("removing role")
+            role = guild.get_role(role_id)
+            if role:
+                self.role_queue.remove(member, role)
+            else:
+                logger.error("Couldnt get role for react role unassign")
 
     @staticmethod
     async def send_chained_message(
         guild: discord.Guild,
         user: discord.User | discord.Member
     ) -> None:
-        vals = db.single_sql(
+        vals = await db.fetch(
             "SELECT ResponseChannelID, Message FROM MessageChain WHERE GuildID=%s", (guild.id,))
         for (response_channel_id, message) in vals:
             msg = message.replace("<<user>>", user.mention)
@@ -1,21 +1,24 @@
 import discord
 import datetime as dt
-from discord.ext import commands, tasks
+from discord.ext import commands, pages
 
 import helpers.database as db
-from helpers.style import Emotes, Colours, TIME, RESET
+from helpers.style import Emotes, Colours
 from helpers.logger import Logger
+from helpers.scheduler import DailyScheduler
+from helpers.scheduler import get_zone, DEFAULT_ZONE
+import helpers.fanout as fanout
+from birthdays.interface import MONTHS, MAX_RANGE, birthdays_on, upcoming
 logger = Logger()
+scheduler = DailyScheduler()
 
-MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+BIRTHDAYS_PER_PAGE = 20  # entries in each page of show_birthdays and upcoming_birthdays
 
 
 class Birthdays(commands.Cog):
     def __init__(self, bot: discord.Bot) -> None:
         self.bot = bot
-        self.daily_bday.start()
-        self.sent_today = False
-        self.reset_bday.start()
+        scheduler.register("birthday", self.daily_bday)
 
     @commands.slash_command(name='set_birthday_channel',
                             description="Sets the channel for the birthday messages")
@@ -25,8 +28,8 @@ class Birthdays(commands.Cog):
         ctx: discord.ApplicationContext,
         channel: discord.TextChannel
     ) -> None:
-        db.single_void_SQL("UPDATE Guilds SET BirthdayChannelID=%s WHERE ID=%s",
-                           (channel.id, ctx.guild_id))
+        await db.execute("UPDATE Guilds SET BirthdayChannelID=%s WHERE ID=%s",
+                         (channel.id, ctx.guild_id))
         await ctx.respond(
             f"Birthday channel set to {channel.mention} {Emotes.DRINKING}",
             ephemeral=True
@@ -43,11 +46,13 @@ class Birthdays(commands.Cog):
             await ctx.respond(f"Sorry, I didn't understand the birthday '{day} {month}'" +
                               f" Are you sure it a valid day? {Emotes.CONFUSED}")
             return
-        db.single_void_SQL(
-            "INSERT INTO Birthdays (GuildID, UserID, Birthdate) VALUES (%s, %s, %s) ON CONFLICT " +
-            "(GuildID, UserID) DO UPDATE SET Birthdate=%s",
-            (ctx.guild.id, ctx.author.id, month + str(day),
-             month + str(day)))
+        # Birthdate is still written for instances running an older version during a deploy
+        await db.execute(
+            "INSERT INTO Birthdays (GuildID, UserID, Birthdate, BirthMonth, BirthDay) " +
+            "VALUES (%s, %s, %s, %s, %s) ON CONFLICT (GuildID, UserID) DO UPDATE SET " +
+            "Birthdate=EXCLUDED.Birthdate, BirthMonth=EXCLUDED.BirthMonth, " +
+            "BirthDay=EXCLUDED.BirthDay",
+            (ctx.guild.id, ctx.author.id, month + str(day), MONTHS.index(month) + 1, day))
         await ctx.respond(
             f"{ctx.author.mention} your birthday is set to {day} {month} {Emotes.UWU}"
         )
@@ -57,55 +62,83 @@ class Birthdays(commands.Cog):
                             description="Shows all tracked birthdays for the server")
     @discord.commands.default_permissions(manage_guild=True)
     async def show_birthdays(self, ctx: discord.ApplicationContext) -> None:
-        vals = db.single_sql(
-            "SELECT UserID, Birthdate from Birthdays WHERE GuildID=%s", (ctx.guild_id,))
-        if vals:
-            out_str = "\n".join(
-                [(await self.bot.fetch_user(user[0])).mention + " : " + user[1] for user in vals]
-            )
-        else:
+        vals = await db.fetch(
+            "SELECT UserID, BirthMonth, BirthDay, Birthdate from Birthdays WHERE GuildID=%s " +
+            "ORDER BY BirthMonth, BirthDay", (ctx.guild_id,))
+        if not vals:
             out_str = "No users have entered their birthday yet! Get started with " +\
                 self.set_birthday.mention
-        embed = discord.Embed(title="Birthday List", description=out_str, color=Colours.PRIMARY)
-        await ctx.respond(embed=embed)
+            embed = discord.Embed(title="Birthday List", description=out_str,
+                                  color=Colours.PRIMARY)
+            await ctx.respond(embed=embed)
+            return
+        # rows not split into month and day yet (sorted last) show the stored text instead
+        await self.respond_paged(ctx, "Birthday List", [
+            f"<@{user_id}> : {day} {MONTHS[month - 1]}" if month and day else
+            f"<@{user_id}> : {birthdate}" for (user_id, month, day, birthdate) in vals])
+
+    @commands.slash_command(name='upcoming_birthdays',
+                            description="Shows the birthdays coming up in the server")
+    @discord.commands.option("days", type=int, description="How many days ahead to look",
+                             min_value=1, max_value=MAX_RANGE, default=30)
+    async def upcoming_birthdays(self, ctx: discord.ApplicationContext, days: int) -> None:
+        zone = await db.fetch("SELECT TimeZone FROM Guilds WHERE ID=%s", (ctx.guild_id,))
+        tzinfo = get_zone((zone[0][0] if zone else None) or DEFAULT_ZONE)
+        today = dt.datetime.now(tzinfo).date()
+        birthdays = await upcoming(ctx.guild_id, today, days)
+        if not birthdays:
+            await ctx.respond(f"No birthdays in the next {days} days {Emotes.NOEMOTION}")
+            return
+        await self.respond_paged(ctx, "Upcoming Birthdays", [
+            f"<@{user_id}> : {day.day} {MONTHS[day.month - 1]}" for (day, user_id) in birthdays])
+
+    @staticmethod
+    async def respond_paged(ctx: discord.ApplicationContext, title: str, lines: list[str]) -> None:
+        """Respond with lines split over as many embeds as needed, with buttons to page through
 
-    @tasks.loop(time=RESET)
-    async def reset_bday(self) -> None:
-        self.sent_today = False
+        Args:
+            ctx (discord.ApplicationContext): Context to respond to
+            title (str): Title of every page
+            lines (list[str]): Lines to show
+        """
+        embeds = [discord.Embed(title=title,
+                                description="\n".join(lines[i:i + BIRTHDAYS_PER_PAGE]),
+                                color=Colours.PRIMARY)
+                  for i in range(0, len(lines), BIRTHDAYS_PER_PAGE)]
+        if len(embeds) == 1:
+            await ctx.respond(embed=embeds[0])
+        else:
+            await pages.Paginator(
+                pages=[pages.Page(embeds=[embed]) for embed in embeds]).respond(ctx.interaction)
 
-    @tasks.loop(time=TIME)
-    async def daily_bday(self) -> None:
+    async def daily_bday(self, guild_days: dict[int, dt.date]) -> None:
         """
         Called daily to check for, and congratulate birthdays to birthday channel
+
+        Args:
+            guild_days (dict[int, dt.date]): IDs of the guilds to check, each with its local date
         """
-        if self.sent_today:
-            return
-        self.sent_today = True
-        logger.info("Starting daily birthday loop")
-        today = dt.date.today().strftime("%b%e").replace(" ", "")
-        val = db.single_sql(
-            "SELECT BirthdayChannelID, string_agg(UserID::varchar, \' \') FROM Birthdays " +
-            "INNER JOIN Guilds ON Birthdays.GuildID=Guilds.ID WHERE Birthdays.Birthdate=%s " +
-            "GROUP BY ID;", (today,))
-        for guild in val:
-            users = " ".join(
-                [(await self.bot.fetch_user(int(user))).mention for user in guild[1].split(" ")]
-            )
-            if guild[0]:
-                logger.debug("Attempting to send birthday message", channel_id=guild[0])
-                try:
-                    channel = await self.bot.fetch_channel(guild[0])
-                    if (not isinstance(channel, discord.abc.Messageable) or
-                            isinstance(channel, discord.abc.PrivateChannel)):
-                        logger.error("Birthday channel set to Private Channel",
-                                     channel_id=channel.id)
-                        continue
-                    (await channel
-                        .send("Happy Birthday to: " + users +
-                              f"!\nHope you have a brilliant day {Emotes.HEART}"))
-                except discord.errors.Forbidden:
-                    logger.info("Permission failure for sending birthday message",
-                                channel_id=guild[0])
+        by_day: dict[dt.date, list[int]] = {}
+        for guild_id, day in guild_days.items():
+            by_day.setdefault(day, []).append(guild_id)
+        val = []
+        for day, guild_ids in by_day.items():
+            val += await db.fetch(
+                "SELECT ID, BirthdayChannelID, array_agg(UserID) FROM Birthdays " +
+                "INNER JOIN Guilds ON Birthdays.GuildID=Guilds.ID WHERE Guilds.ID = ANY(%s) " +
+                "AND Birthdays.BirthMonth=%s AND Birthdays.BirthDay = ANY(%s) GROUP BY ID;",
+                (guild_ids, *birthdays_on(day)))
+        deliveries: list[fanout.Delivery] = []
+        for (guild_id, channel_id, user_ids) in val:
+            if not channel_id:
+                continue
+            users = " ".join([f"<@{user_id}>" for user_id in user_ids])
+
+            async def send(channel: discord.abc.Messageable, users: str = users) -> None:
+                await channel.send("Happy Birthday to: " + users +
+                                   f"!\nHope you have a brilliant day {Emotes.HEART}")
+            deliveries.append(fanout.Delivery(channel_id, guild_days[guild_id], send))
+        await fanout.broadcast(self.bot, "birthday", deliveries)
 
 
 def setup(bot: discord.Bot) -> None:
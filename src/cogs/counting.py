@@ -1,57 +1,79 @@
 import discord
-import asyncio
 from discord.ext import commands
 
 import helpers.database as db
 from helpers.style import Emotes
 from helpers.logger import Logger
+from helpers.dispatcher import MessageDispatcher, Feature
+from counting.interface import CountingEngine, CountingState, CountResult
 
 logger = Logger()
+dispatcher = MessageDispatcher()
 
 
 class Counting(commands.Cog):
     def __init__(self) -> None:
-        self.lock = asyncio.Lock()
+        self.engine = CountingEngine()
+        dispatcher.register(Feature.COUNTING, self.count, self.counting_channels)
+
+    @commands.Cog.listener("on_ready")
+    async def restore_counts(self) -> None:
+        await self.engine.restore()
+
+    @commands.Cog.listener("on_guild_remove")
+    async def forget_guild(self, guild: discord.Guild) -> None:
+        self.engine.forget(guild.id)
+
+    @staticmethod
+    async def counting_channels() -> list[tuple[int, int]]:
+        """Get the counting channel of every guild that has one
+
+        Returns:
+            list[tuple[int, int]]: (guild ID, channel ID) pairs
+        """
+        return [(guild_id, channel_id) for (guild_id, channel_id) in await db.fetch(
+            "SELECT ID, CountingChannelID FROM Guilds WHERE CountingChannelID IS NOT NULL")]
 
-    @commands.Cog.listener("on_message")
     async def count(self, msg: discord.Message) -> None:
         """
-        Triggered on all messages, used to check for counting game
+        Triggered on messages in counting channels, used to check for counting game
 
         Args:
             msg (discord.Message): Message that triggered function
         """
-        async with self.lock:
-            if msg.content.isdigit():
-                if msg.guild is None:
-                    return
-                values = db.single_sql(
-                    "SELECT CountingChannelID, CurrentCount, LastCounterID, "
-                    "FailRoleID FROM Guilds WHERE ID=%s", (msg.guild.id,))
-                (chnl_id, curr_ct, last_ctr_id, fail_id) = values[0]
-                if msg.channel.id == chnl_id:
-                    logger.debug("Integer message detacted in counting channel")
-                    if int(msg.content) != curr_ct + 1:
-                        logger.debug("Wrong number detected in counting channel")
-                        await self.fail(msg, "Wrong number", fail_id)
-                    elif msg.author.id == last_ctr_id:
-                        logger.debug("Double-user-input detected in counting channel")
-                        await self.fail(msg, "Same user entered two numbers", fail_id)
-                    else:
-                        await msg.add_reaction(Emotes.BLEP)
-                        db.single_void_SQL(
-                            "UPDATE Guilds SET LastCounterID =%s, CurrentCount = CurrentCount+1, " +
-                            "HighScoreCounting=(CASE WHEN %s>HighScoreCounting THEN %s ELSE " +
-                            "HighScoreCounting END) WHERE ID =%s",
-                            (msg.author.id, msg.content, msg.content, msg.guild.id))
+        if not msg.content.isdigit() or msg.guild is None:
+            return
+        state = await self.engine.get_state(msg.guild.id)
+        if state is None:
+            return
+        logger.debug("Integer message detacted in counting channel")
+        outcome = await self.engine.step(msg.guild.id, msg.channel.id, msg.id,
+                                         int(msg.content), msg.author.id)
+        if outcome is None:
+            return
+        (result, repeated) = outcome
+        if repeated:
+            logger.debug("Counting message was already handled")
+            return
+        if result == CountResult.WRONG_NUMBER:
+            logger.debug("Wrong number detected in counting channel")
+            await self.fail(msg, "Wrong number", state)
+        elif result == CountResult.SAME_USER:
+            logger.debug("Double-user-input detected in counting channel")
+            await self.fail(msg, "Same user entered two numbers", state)
+        elif result == CountResult.CORRECT:
+            await msg.add_reaction(Emotes.BLEP)
 
     @commands.slash_command(name='set_fail_role',
                             description="Sets the role the given to users who fail at counting")
     @discord.commands.default_permissions(manage_guild=True)
     async def set_fail_role(self, ctx: discord.ApplicationContext, role: discord.Role) -> None:
         logger.info("fail_role set")
-        db.single_void_SQL("UPDATE Guilds SET FailRoleID=%s WHERE ID=%s",
-                           (role.id, ctx.guild_id))
+        await db.execute("UPDATE Guilds SET FailRoleID=%s WHERE ID=%s",
+                         (role.id, ctx.guild_id))
+        state = await self.engine.get_state(ctx.guild.id)
+        if state:
+            state.fail_role_id = role.id
         await ctx.respond(
             f"The fail role is set to {role.mention} {Emotes.DRINKING}", ephemeral=True
         )
@@ -65,8 +87,9 @@ class Counting(commands.Cog):
         channel: discord.TextChannel
     ) -> None:
         logger.info("counting_channel set")
-        db.single_void_SQL("UPDATE Guilds SET CountingChannelID=%s WHERE ID=%s",
-                           (channel.id, ctx.guild_id))
+        await db.execute("UPDATE Guilds SET CountingChannelID=%s WHERE ID=%s",
+                         (channel.id, ctx.guild_id))
+        await dispatcher.refresh(Feature.COUNTING)
         await ctx.respond(
             f"Counting channel set to {channel.mention} {Emotes.DRINKING}", ephemeral=True
         )
@@ -74,27 +97,25 @@ class Counting(commands.Cog):
     @commands.slash_command(name='get_highscore',
                             description="Shows you the highest count your server has reached")
     async def get_highscore(self, ctx: discord.ApplicationContext) -> None:
-        highscore = db.single_sql(
+        highscore = await db.fetch(
             "SELECT HighScoreCounting FROM Guilds WHERE ID = %s", (ctx.guild.id,))
         await ctx.respond(f"Your server highscore is {highscore[0][0]}! {Emotes.WHOA}")
 
     @staticmethod
-    async def fail(msg: discord.Message, err_txt: str, roleID: int) -> None:
+    async def fail(msg: discord.Message, err_txt: str, state: CountingState) -> None:
         """
         Handles a generic counting failure
 
         Args:
             msg (discord.Message): Message that failed
             err_txt (string): Failure message to print to channel
-            roleID (int): ID of role to assign to user that failed
+            state (CountingState): Counting state of the guild
         """
         if msg.guild is None or not isinstance(msg.author, discord.Member):
             return
-        db.single_void_SQL(
-            "UPDATE Guilds SET CurrentCount=0, LastCounterID=NULL WHERE ID=%s", (msg.guild.id,))
         await msg.add_reaction(Emotes.CRYING)
         await msg.channel.send(f"Counting Failed {Emotes.CRYING} {err_txt}")
-        role = msg.guild.get_role(roleID)
+        role = msg.guild.get_role(state.fail_role_id) if state.fail_role_id else None
         if role:
             try:
                 await msg.author.add_roles(role, reason="failed the counting")
@@ -104,7 +125,8 @@ class Counting(commands.Cog):
                                        f"{role.mention} role {Emotes.CONFUSED} " +
                                        "(I need 'Manage Roles' to do that)" +
                                        "\nI won't try again until you set a new fail role")
-                db.single_void_SQL("UPDATE Guilds SET FailRoleID=NULL WHERE ID=%s", (msg.guild.id,))
+                state.fail_role_id = None
+                await db.execute("UPDATE Guilds SET FailRoleID=NULL WHERE ID=%s", (msg.guild.id,))
         else:
             logger.error("Couldnt get fail role for counting")
 
@@ -1,8 +1,17 @@
 import discord
+import asyncpraw as praw  # type: ignore[import]
+import inspect
+import time
 from discord.ext import commands
 
-from helpers.logger import Logger
+from helpers.logger import Logger, Priority
 import helpers.database as db
+from counting.interface import CountingEngine
+from helpers.env import CLIENT_ID, SECRET_KEY, USER_AGENT
+from reddit.client import get_reddit
+from reddit.cache import LISTINGS, SUBREDDITS
+from reddit.media import MEDIA
+from reddit.ui_kit import PREFETCH_STATS
 
 logger = Logger()
 
@@ -13,7 +22,7 @@ class Debug(commands.Cog):
 
     @commands.slash_command(name='sql', description='log sql data')
     async def get_sql(self, ctx: discord.ApplicationContext, text: str) -> None:
-        vals = db.select_from_unsafe(text)
+        vals = await db.select_from_unsafe(text)
         logger.info(vals)
         await ctx.respond("Check logs for output")
 
@@ -22,6 +31,118 @@ class Debug(commands.Cog):
         await self.bot.sync_commands()
         await ctx.respond("Synced")
 
+    @commands.slash_command(name='rest_stats',
+                            description="Log how often react role removal needed REST requests")
+    async def rest_stats(self, ctx: discord.ApplicationContext) -> None:
+        resolver = getattr(self.bot.get_cog("Admin"), "resolver", None)
+        stats = dict(resolver.stats) if resolver is not None else {}
+        logger.info(f"Resolver stats: {stats}")
+        await ctx.respond(f"Resolver stats: {stats}")
+
+    @commands.slash_command(name='reddit_stats',
+                            description="Log reddit cache, media and post prefetch counts")
+    async def reddit_stats(self, ctx: discord.ApplicationContext) -> None:
+        stats = (f"Listings: {dict(LISTINGS.stats)}, subreddits: {dict(SUBREDDITS.stats)}, " +
+                 f"media: {dict(MEDIA.stats)}, prefetch: {dict(PREFETCH_STATS)}")
+        logger.info(stats)
+        await ctx.respond(stats)
+
+    @commands.slash_command(name='bench_counting',
+                            description="Benchmark the old and new counting steps on the test db")
+    async def bench_counting(self, ctx: discord.ApplicationContext, steps: int = 200) -> None:
+        await ctx.defer()
+        guild_id, channel_id = 0, 0
+        await db.execute(
+            "INSERT INTO Guilds (ID, CountingChannelID, BirthdayChannelID, FactChannelID, " +
+            "CurrentCount, LastCounterID, HighScoreCounting, FailRoleID) " +
+            "VALUES (%s, %s, NULL, NULL, 0, NULL, 0, NULL)", (guild_id, channel_id))
+        try:
+            start = time.perf_counter()
+            for number in range(1, steps + 1):
+                (chnl_id, curr_ct, last_ctr_id) = (await db.fetch(
+                    "SELECT CountingChannelID, CurrentCount, LastCounterID FROM Guilds " +
+                    "WHERE ID=%s", (guild_id,)))[0]
+                if chnl_id == channel_id and number == curr_ct + 1 and number != last_ctr_id:
+                    await db.execute(
+                        "UPDATE Guilds SET LastCounterID =%s, CurrentCount = CurrentCount+1, " +
+                        "HighScoreCounting=(CASE WHEN %s>HighScoreCounting THEN %s ELSE " +
+                        "HighScoreCounting END) WHERE ID =%s",
+                        (number, number, number, guild_id))
+            old = (time.perf_counter() - start) / steps
+
+            await db.execute("UPDATE Guilds SET CurrentCount=0, LastCounterID=NULL WHERE ID=%s",
+                             (guild_id,))
+            engine = CountingEngine()
+            await engine.get_state(guild_id)
+            start = time.perf_counter()
+            for number in range(1, steps + 1):
+                await engine.step(guild_id, channel_id, number, number, number)
+            new = (time.perf_counter() - start) / steps
+        finally:
+            await db.execute("DELETE FROM Guilds WHERE ID=%s", (guild_id,))
+
+        result = (f"Counting step over {steps} steps: SELECT+UPDATE {old * 1000:.3f}ms, " +
+                  f"UPDATE ... RETURNING {new * 1000:.3f}ms")
+        logger.info(result)
+        await ctx.respond(result)
+
+    @commands.slash_command(name='bench_logger',
+                            description="Benchmark the cost of a filtered out debug log call")
+    async def bench_logger(self, ctx: discord.ApplicationContext, calls: int = 10000) -> None:
+        def old_debug(message: str) -> None:
+            # the caller lookup the logger used to do before checking the level
+            try:
+                call_class = inspect.stack()[1][0].f_locals["self"].__class__.__name__
+            except KeyError:
+                call_class = "No class"
+            if Priority.DEBUG.value >= logger.print_level:
+                print(call_class, message)
+
+        level = logger.print_level
+        logger.print_level = Priority.INFO.value
+        try:
+            start = time.perf_counter()
+            for _ in range(calls // 100 or 1):
+                old_debug("benchmark")
+            old = (time.perf_counter() - start) / (calls // 100 or 1)
+            start = time.perf_counter()
+            for _ in range(calls):
+                logger.debug("benchmark")
+            new = (time.perf_counter() - start) / calls
+        finally:
+            logger.print_level = level
+
+        result = (f"Filtered debug call: inspect.stack() {old * 1e6:.2f}us, " +
+                  f"level check first {new * 1e6:.3f}us")
+        logger.info(result)
+        await ctx.respond(result)
+
+    @commands.slash_command(name='bench_reddit',
+                            description="Benchmark a subreddit lookup with a new or shared client")
+    async def bench_reddit(
+        self,
+        ctx: discord.ApplicationContext,
+        subreddit: str = "aww",
+        calls: int = 5
+    ) -> None:
+        await ctx.defer()
+        start = time.perf_counter()
+        for _ in range(calls):
+            async with praw.Reddit(client_id=CLIENT_ID,
+                                   client_secret=SECRET_KEY,
+                                   user_agent=USER_AGENT) as instance:
+                await (await instance.subreddit(subreddit)).load()
+        old = (time.perf_counter() - start) / calls
+        start = time.perf_counter()
+        for _ in range(calls):
+            await (await get_reddit().subreddit(subreddit)).load()
+        new = (time.perf_counter() - start) / calls
+
+        result = (f"Subreddit lookup over {calls} calls: new client {old * 1000:.0f}ms, " +
+                  f"shared client {new * 1000:.0f}ms")
+        logger.info(result)
+        await ctx.respond(result)
+
 
 def setup(bot: discord.Bot) -> None:
     bot.add_cog(Debug(bot))
@@ -8,13 +8,16 @@ from google import genai
 from helpers.style import Colours, Emotes
 from helpers.env import CAI_TOKEN, CAI_NIX_ID
 from helpers.logger import Logger
+from helpers.dispatcher import MessageDispatcher, Feature
 
 logger = Logger()
+dispatcher = MessageDispatcher()
 
 
 class Misc(commands.Cog):
     def __init__(self, bot: discord.Bot) -> None:
         self.bot = bot
+        dispatcher.register(Feature.MENTION, self.respond)
 
     @commands.slash_command(
         name='quote',
@@ -51,7 +54,6 @@ class Misc(commands.Cog):
         await ctx.interaction.response.send_message(embed=view.build_embed(), view=view)
         logger.info("Displaying short help", member_id=ctx.author.id, channel_id=ctx.channel_id)
 
-    @commands.Cog.listener("on_message")
     async def respond(self, msg: discord.Message) -> None:
         """
         Prints out an AI generated response to the message if it mentions Nix
@@ -1,26 +1,78 @@
 import discord
-from discord.ext import commands, tasks
+import asyncio
+import datetime as dt
+from discord.ext import commands
 
 import helpers.database as db
-from helpers.style import Emotes, Colours, TIME, RESET
+from helpers.style import Emotes, Colours
 import reddit.ui_kit as ui
-from reddit.interface import RedditInterface
+from reddit.interface import RedditInterface, DailyPosts
+from reddit.cache import SUBREDDITS
+from reddit.index import AUTOCOMPLETE_LIMIT, SUBSCRIPTIONS
 from helpers.logger import Logger
+from helpers.scheduler import DailyScheduler
+import helpers.fanout as fanout
 
 logger = Logger()
+scheduler = DailyScheduler()
 
 
 class Reddit(commands.Cog):
     def __init__(self, bot: discord.Bot) -> None:
         self.bot = bot
-        self.daily_post.start()
-        self.sent_today = False
-        self.reset_reddit.start()
+        scheduler.register("reddit", self.daily_post)
+
+    @commands.Cog.listener("on_ready")
+    async def restore_subscriptions(self) -> None:
+        await SUBSCRIPTIONS.restore()
+
+    def complete_subreddit(self, ctx: discord.AutocompleteContext) -> list[str]:
+        """
+        Suggest the guild's subscriptions, then other subreddits known to exist. No network I/O
+
+        Args:
+            ctx (discord.AutocompleteContext): Context of the autocomplete request
+
+        Returns:
+            list[str]: Suggested subreddit names
+        """
+        subscribed = SUBSCRIPTIONS.of(ctx.interaction.guild_id)
+        found = subscribed.complete(ctx.value or "")
+        found += [name for name in SUBREDDITS.names.complete(ctx.value or "")
+                  if name not in subscribed]
+        return found[:AUTOCOMPLETE_LIMIT]
+
+    def complete_new_subscription(self, ctx: discord.AutocompleteContext) -> list[str]:
+        """
+        Suggest subreddits known to exist that the guild is not subscribed to. No network I/O
+
+        Args:
+            ctx (discord.AutocompleteContext): Context of the autocomplete request
+
+        Returns:
+            list[str]: Suggested subreddit names
+        """
+        subscribed = SUBSCRIPTIONS.of(ctx.interaction.guild_id)
+        return [name for name in SUBREDDITS.names.complete(ctx.value or "")
+                if name not in subscribed]
+
+    def complete_subscription(self, ctx: discord.AutocompleteContext) -> list[str]:
+        """
+        Suggest the guild's subscriptions. No network I/O
+
+        Args:
+            ctx (discord.AutocompleteContext): Context of the autocomplete request
+
+        Returns:
+            list[str]: Suggested subreddit names
+        """
+        return SUBSCRIPTIONS.of(ctx.interaction.guild_id).complete(ctx.value or "")
 
     @commands.slash_command(
         name='reddit',
         description="Displays a random top reddit post from the given subreddit"
     )
+    @discord.commands.option("subreddit", type=str, autocomplete=complete_subreddit)
     @discord.commands.option(
         "time",
         type=str,
@@ -46,6 +98,7 @@ class Reddit(commands.Cog):
 
     @commands.slash_command(name='subscribe',
                             description="Subscribe to a subreddit to get daily posts from it")
+    @discord.commands.option("sub", type=str, autocomplete=complete_new_subscription)
     @discord.commands.option("channel", type=discord.TextChannel, required=False)
     @discord.commands.default_permissions(manage_guild=True)
     async def subscribe_to_sub(
@@ -60,7 +113,7 @@ class Reddit(commands.Cog):
         if not await RedditInterface.valid_sub(sub):
             logger.warning(f"Subreddit {sub} is not valid", guild_id=ctx.guild_id)
             await ctx.respond(f"The subreddit {sub} is not available {Emotes.EVIL}")
-        elif (sub.lower(),) in db.single_sql(
+        elif (sub.lower(),) in await db.fetch(
             "SELECT Subreddit FROM Subreddits WHERE GuildID=%s",
             (ctx.guild_id,)
         ):
@@ -70,22 +123,24 @@ class Reddit(commands.Cog):
         else:
             logger.info(f"Subreddit {sub} got subscribed to",
                         guild_id=ctx.guild_id, channel_id=channel.id)
-            db.single_void_SQL(
+            await db.execute(
                 "INSERT INTO Subreddits (GuildID, Subreddit, SubredditChannelID) " +
                 "VALUES (%s, %s, %s)",
                 (ctx.guild_id, sub.lower(),
                  channel.id))
+            SUBSCRIPTIONS.add(ctx.guild_id, sub.lower(), channel.id)
             await ctx.respond(f"This server is now subscribed to {sub} {Emotes.HUG}")
 
     @commands.slash_command(name='unsubscribe',
                             description="Unsubscribe to daily posts from the given subreddit")
-    @discord.commands.option("sub", type=str, required=False)
+    @discord.commands.option("sub", type=str, required=False,
+                             autocomplete=complete_subscription)
     @discord.commands.default_permissions(manage_guild=True)
     async def unsubscribe_from_sub(self, ctx: discord.ApplicationContext, sub: str) -> None:
         if not sub:
             await self.get_subs(ctx)
             return
-        if (sub.lower(),) not in db.single_sql(
+        if (sub.lower(),) not in await db.fetch(
             "SELECT Subreddit FROM Subreddits WHERE GuildID=%s",
             (ctx.guild_id,)
         ):
@@ -94,14 +149,16 @@ class Reddit(commands.Cog):
         else:
             logger.info(f"Subreddit {sub} was unsubscribed from",
                         guild_id=ctx.guild_id, channel_id=ctx.channel_id)
-            db.single_void_SQL(
-                "DELETE FROM Subreddits WHERE GuildID=%s AND Subreddit=%s ", (ctx.guild_id, sub))
+            await db.execute(
+                "DELETE FROM Subreddits WHERE GuildID=%s AND Subreddit=%s ",
+                (ctx.guild_id, sub.lower()))
+            SUBSCRIPTIONS.discard(ctx.guild_id, sub)
             await ctx.respond(f"This server is now unsubscribed from r/{sub} {Emotes.SNEAKY}")
 
     @commands.slash_command(name='subscriptions',
                             description="Get a list of the subscriptions of the server")
     async def get_subs(self, ctx: discord.ApplicationContext) -> None:
-        subscriptions = db.single_sql(
+        subscriptions = await db.fetch(
             "SELECT Subreddit FROM Subreddits WHERE GuildID=%s", (ctx.guild_id,))
         logger.info("The list of subscripted subreddits was requested",
                     guild_id=ctx.guild_id, channel_id=ctx.channel_id)
@@ -119,36 +176,29 @@ class Reddit(commands.Cog):
             colour=Colours.PRIMARY)
         await ctx.respond(embed=embed)
 
-    @tasks.loop(time=RESET)
-    async def reset_reddit(self) -> None:
-        self.sent_today = False
-
-    @tasks.loop(time=TIME)
-    async def daily_post(self) -> None:
+    async def daily_post(self, guild_days: dict[int, dt.date]) -> None:
         """
         Called daily to print random post from subbed sub to linked discord channel
+
+        Args:
+            guild_days (dict[int, dt.date]): IDs of the guilds to send to, each with its local date
         """
-        if self.sent_today:
-            return
-        self.sent_today = True
-        logger.info("Starting daily reddit loop")
-        subs = db.single_sql("SELECT GuildID, Subreddit, SubredditChannelID FROM Subreddits")
-        for entry in subs:
-            logger.info(f"Attempting to send reddit daily post <subreddit: {entry[1]}>",
-                        guild_id=entry[0], channel_id=entry[2])
-            try:
-                channel = await self.bot.fetch_channel(entry[2])
-                is_nsfw = False
-                if isinstance(channel, discord.TextChannel):
-                    is_nsfw = channel.is_nsfw()
-                post = await RedditInterface.single_post(entry[1], is_nsfw, "day")
-                if not isinstance(channel, discord.abc.Messageable):
-                    logger.error("reddit daily post channel is not sendable")
-                    continue
+        subs = await db.fetch(
+            "SELECT GuildID, Subreddit, SubredditChannelID FROM Subreddits WHERE GuildID = ANY(%s)",
+            (list(guild_days),))
+        names = sorted({subreddit for (_, subreddit, _) in subs})
+        pools = dict(zip(names, await asyncio.gather(*[DailyPosts.load(name) for name in names])))
+        deliveries: list[fanout.Delivery] = []
+        for (guild_id, subreddit, channel_id) in subs:
+            pool = pools[subreddit]
+
+            async def send(channel: discord.abc.Messageable, pool: DailyPosts = pool) -> None:
+                is_nsfw = isinstance(channel, discord.TextChannel) and channel.is_nsfw()
+                post = await pool.take(is_nsfw).load_img()
                 await channel.send("__Daily post__\n" + post.text, files=post.img)
-            except discord.errors.Forbidden:
-                logger.info(f"Permission failure for daily reddit post <subreddit: {entry[1]}>",
-                            guild_id=entry[0], channel_id=entry[2])
+            deliveries.append(
+                fanout.Delivery(channel_id, guild_days[guild_id], send, tag=subreddit))
+        await fanout.broadcast(self.bot, "reddit", deliveries)
 
 
 def setup(bot: discord.Bot) -> None:
@@ -4,11 +4,13 @@ from discord.ext import commands
 
 from helpers.logger import Logger
 from helpers.style import Emotes, Colours
+from helpers.dispatcher import MessageDispatcher, Feature
 
 from trivia.interface import TriviaGame
 from trivia.ui_kit import TriviaView
 
 logger = Logger()
+dispatcher = MessageDispatcher()
 
 CATEGORY_DICT = {
     "General Knowledge": "general_knowledge",
@@ -29,6 +31,7 @@ class Trivia(commands.Cog):
     def __init__(self, bot: discord.Bot) -> None:
         self.bot = bot
         self.active_views: typing.Dict[int, TriviaView] = {}
+        dispatcher.register(Feature.TRIVIA, self.on_guess)
 
     @commands.slash_command(
         name='trivia',
@@ -50,6 +53,7 @@ class Trivia(commands.Cog):
 
         def remove_view(channel_id: int) -> None:
             logger.debug("TrivaGame view stopped")
+            dispatcher.remove(Feature.TRIVIA, channel_id)
             try:
                 self.active_views.pop(channel_id)
             except KeyError:
@@ -58,6 +62,8 @@ class Trivia(commands.Cog):
         view = TriviaView(game_state, remove_view, ctx.channel_id)
 
         self.active_views.update({ctx.channel_id: view})
+        if ctx.guild_id is not None:
+            dispatcher.add(Feature.TRIVIA, ctx.guild_id, ctx.channel_id)
         await ctx.respond(
             embed=discord.Embed(
                 title=f"{Emotes.UWU} You have started a game of Trivia",
@@ -74,7 +80,6 @@ class Trivia(commands.Cog):
         else:
             await ctx.send(text, view=view)
 
-    @commands.Cog.listener("on_message")
     async def on_guess(self, msg: discord.Message) -> None:
         if isinstance(msg.channel, discord.abc.PrivateChannel):
             logger.info("on_guess activated in PrivateChannel", channel_id=msg.channel.id)
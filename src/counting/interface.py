@@ -0,0 +1,153 @@
+import asyncio
+import typing
+from enum import Enum
+
+import helpers.database as db
+from helpers.logger import Logger
+
+logger = Logger()
+
+
+class CountResult(Enum):
+    CORRECT = 0
+    WRONG_NUMBER = 1
+    SAME_USER = 2
+
+
+class CountingState:
+    """In-memory counting state of a single guild
+
+    Args:
+        current_count (int): Last correctly counted number
+        last_counter_id (int | None): ID of the last member to count correctly
+        high_score (int): Highest count reached
+        fail_role_id (int | None): ID of the role given to members who fail
+    """
+
+    def __init__(
+        self,
+        current_count: int,
+        last_counter_id: int | None,
+        high_score: int,
+        fail_role_id: int | None
+    ) -> None:
+        self.current_count = current_count
+        self.last_counter_id = last_counter_id
+        self.high_score = high_score
+        self.fail_role_id = fail_role_id
+        self.lock = asyncio.Lock()
+
+
+class CountingEngine:
+    """Keeps a mirror of the counting state of every guild in memory
+
+    The count itself is advanced by a single conditional statement in the database, which
+    also checks the counting channel, so several Nix processes can serve the same guild. The
+    ID and outcome of the last message applied are stored with the count, so a message every
+    process receives is applied once; the others get the stored outcome as a repeat
+    """
+
+    _COLUMNS = ("SELECT ID, CurrentCount, LastCounterID, HighScoreCounting, " +
+                "FailRoleID FROM Guilds")
+
+    # Locks the guild row, then either advances or resets the count depending on the old
+    # values. A message at or before the last one applied changes nothing, and gets the stored
+    # outcome if it is that message (NULL if it is older). Returns the outcome (see
+    # CountResult) and if it is a repeat, with the new row values.
+    _STEP = (
+        "WITH old AS (SELECT ID, CurrentCount, LastCounterID, LastMessageID, LastResult " +
+        "FROM Guilds WHERE ID=%s AND CountingChannelID=%s FOR UPDATE), " +
+        "outcome AS (SELECT ID, COALESCE(LastMessageID>=%s, FALSE) AS Repeated, " +
+        "CASE WHEN LastMessageID=%s THEN LastResult WHEN LastMessageID>%s THEN NULL " +
+        "WHEN CurrentCount+1<>%s THEN 1 " +
+        "WHEN LastCounterID IS NOT DISTINCT FROM %s THEN 2 ELSE 0 END AS Result FROM old) " +
+        "UPDATE Guilds SET " +
+        "CurrentCount=(CASE WHEN Repeated THEN CurrentCount WHEN Result=0 THEN %s ELSE 0 END), " +
+        "LastCounterID=(CASE WHEN Repeated THEN LastCounterID WHEN Result=0 THEN %s " +
+        "ELSE NULL END), " +
+        "HighScoreCounting=(CASE WHEN NOT Repeated AND Result=0 AND %s>HighScoreCounting " +
+        "THEN %s ELSE HighScoreCounting END), " +
+        "LastMessageID=(CASE WHEN Repeated THEN LastMessageID ELSE %s END), " +
+        "LastResult=(CASE WHEN Repeated THEN LastResult ELSE Result END) " +
+        "FROM outcome WHERE Guilds.ID=outcome.ID " +
+        "RETURNING Result, Repeated, CurrentCount, LastCounterID, HighScoreCounting, FailRoleID"
+    )
+
+    def __init__(self) -> None:
+        self._states: dict[int, CountingState] = {}
+
+    @staticmethod
+    def _from_row(row: tuple[typing.Any, ...]) -> CountingState:
+        (_, curr_ct, last_ctr_id, high_score, fail_id) = row
+        return CountingState(curr_ct or 0, last_ctr_id, high_score or 0, fail_id)
+
+    async def restore(self) -> None:
+        """Load the state of every guild from the database"""
+        rows = await db.fetch(self._COLUMNS)
+        for row in rows:
+            self._states[row[0]] = self._from_row(row)
+        logger.info(f"Restored counting state for {len(rows)} guilds")
+
+    async def get_state(self, guild_id: int) -> CountingState | None:
+        """Get the counting state of a guild, loading it if it is not in memory
+
+        Args:
+            guild_id (int): ID of the guild
+
+        Returns:
+            CountingState | None: The guild state, or None if the guild has no entry
+        """
+        state = self._states.get(guild_id)
+        if state is None:
+            rows = await db.fetch(self._COLUMNS + " WHERE ID=%s", (guild_id,))
+            if not rows:
+                return None
+            state = self._states.setdefault(guild_id, self._from_row(rows[0]))
+        return state
+
+    async def step(
+        self,
+        guild_id: int,
+        channel_id: int,
+        message_id: int,
+        number: int,
+        author_id: int
+    ) -> tuple[CountResult, bool] | None:
+        """Advance the count, or reset it if the number or counter is wrong
+
+        Args:
+            guild_id (int): ID of the guild
+            channel_id (int): ID of the channel the number was entered in
+            message_id (int): ID of the message the number was entered in
+            number (int): Number that was entered
+            author_id (int): ID of the member that entered it
+
+        Returns:
+            tuple[CountResult, bool] | None: Outcome of the step, and True if the message was
+                already applied (by this or another process) so nothing changed. None if the
+                channel is not the counting channel of the guild, or a later message has
+                already been applied
+        """
+        state = await self.get_state(guild_id)
+        if state is None:
+            return None
+        # the lock only keeps steps in message order, the statement itself is atomic
+        async with state.lock:
+            rows = await db.fetch(self._STEP, (
+                guild_id, channel_id, message_id, message_id, message_id, number, author_id,
+                number, author_id, number, number, message_id))
+        if not rows:
+            return None
+        (result, repeated, state.current_count, state.last_counter_id,
+         state.high_score, state.fail_role_id) = rows[0]
+        if result is None:
+            return None
+        return (CountResult(result), repeated)
+
+    def forget(self, guild_id: int) -> None:
+        """Drop the state of a guild (i.e. when Nix leaves it)
+
+        Args:
+            guild_id (int): ID of the guild
+        """
+        self._states.pop(guild_id, None)
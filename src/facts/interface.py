@@ -0,0 +1,80 @@
+import asyncio
+import aiohttp
+from collections import deque
+
+from helpers.env import NINJA_API_KEY
+from helpers.http import get_session
+from helpers.logger import Logger
+
+logger = Logger()
+
+API_URL = 'https://api.api-ninjas.com/v1/facts'
+BUFFER_SIZE = 5  # facts kept ready in memory
+WAIT_FOR_FACT = 2  # seconds to wait for a fact when the buffer is empty
+
+
+class FactInterface:
+    """Interface for getting facts from API-Ninjas
+
+    Keeps a small buffer of facts that is refilled in the background, so getting a fact
+    usually does not wait on the API
+    """
+
+    def __init__(self) -> None:
+        self._cache: deque[str] = deque(maxlen=BUFFER_SIZE)
+        self._refill: asyncio.Task[None] | None = None
+        self._available = asyncio.Event()
+
+    async def _request_fact(self) -> str | None:
+        if NINJA_API_KEY is None:
+            logger.error("NINJA_API_KEY variable not available")
+            return None
+        try:
+            async with get_session().get(API_URL, headers={'X-Api-Key': NINJA_API_KEY}) as resp:
+                cjson = await resp.json(content_type=None)
+                if resp.status == 200:
+                    return str(cjson[0]["fact"])
+                logger.error(f"Fact Error {resp.status}: {cjson}")
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, LookupError) as e:
+            logger.error(f"Fact Error: {e.__class__.__name__}")
+        return None
+
+    async def _fill_cache(self) -> None:
+        """Refill fact cache, stopping early if the API fails"""
+        while len(self._cache) < BUFFER_SIZE:
+            fact = await self._request_fact()
+            if fact is None:
+                self._available.set()  # wake waiters, there is nothing more coming
+                return
+            self._cache.append(fact)
+            self._available.set()
+        logger.debug("Successful fact cache refill")
+
+    def refill(self) -> asyncio.Task[None]:
+        """Start refilling the cache in the background, unless it is already refilling
+
+        Returns:
+            asyncio.Task[None]: The running refill
+        """
+        if self._refill is None or self._refill.done():
+            self._refill = asyncio.create_task(self._fill_cache())
+        return self._refill
+
+    async def get_fact(self) -> str | None:
+        """Gets a random fact
+
+        Answers from the buffer, only waiting (briefly) on the API if the buffer is empty
+
+        Returns:
+            str | None: Random fact or None if there was an error getting a fact
+        """
+        if not self._cache:
+            self._available.clear()
+            self.refill()
+            try:
+                await asyncio.wait_for(self._available.wait(), WAIT_FOR_FACT)
+            except asyncio.TimeoutError:
+                logger.warning("Timed out waiting for a fact")
+        fact = self._cache.popleft() if self._cache else None
+        self.refill()
+        return fact
@@ -1,9 +1,13 @@
+import asyncio
 import psycopg2
 from psycopg2.errors import UniqueViolation
+from psycopg2.pool import ThreadedConnectionPool
+import threading
 import typing
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 
-from helpers.env import DATABASE_URL
+from helpers.env import DATABASE_URL, DB_POOL_MIN, DB_POOL_MAX
 from helpers.logger import Logger
 
 logger = Logger()
@@ -13,76 +17,116 @@ class KeyViolation(Exception):
     pass
 
 
-def select_from_unsafe(table_name: str) -> typing.List[typing.Tuple[typing.Any, ...]]:
-    """logs select from table. ONLY FOR TESTING
-
-    Args:
-        table_name (str): table to select from
+MIGRATIONS = [
+    "ALTER TABLE Guilds ADD COLUMN IF NOT EXISTS DeliveryTime SMALLINT",
+    "ALTER TABLE Guilds ADD COLUMN IF NOT EXISTS TimeZone TEXT",
+    "CREATE TABLE IF NOT EXISTS JobRuns(Job TEXT, GuildID BIGINT, LastRun DATE NOT NULL, " +
+    "PRIMARY KEY(Job, GuildID))",
+    "CREATE TABLE IF NOT EXISTS Deliveries(Job TEXT, Day DATE, ChannelID BIGINT, " +
+    "Tag TEXT NOT NULL DEFAULT '', PRIMARY KEY(Job, Day, ChannelID, Tag))",
+    "ALTER TABLE Birthdays ADD COLUMN IF NOT EXISTS BirthMonth SMALLINT",
+    "ALTER TABLE Birthdays ADD COLUMN IF NOT EXISTS BirthDay SMALLINT",
+    # Birthdate is the source of truth while older instances only write it, so the trigger
+    # derives BirthMonth/BirthDay on every write, and the backfill reruns it for older rows
+    "CREATE OR REPLACE FUNCTION SplitBirthdate() RETURNS trigger AS $$ BEGIN " +
+    "IF NEW.Birthdate ~ '^[A-Z][a-z]{2}[0-9]{1,2}$' THEN " +
+    "NEW.BirthMonth := array_position(ARRAY['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', " +
+    "'Aug', 'Sep', 'Oct', 'Nov', 'Dec'], left(NEW.Birthdate, 3)); " +
+    "NEW.BirthDay := substr(NEW.Birthdate, 4)::SMALLINT; " +
+    "END IF; RETURN NEW; END $$ LANGUAGE plpgsql",
+    "DROP TRIGGER IF EXISTS SplitBirthdate ON Birthdays",
+    "CREATE TRIGGER SplitBirthdate BEFORE INSERT OR UPDATE OF Birthdate ON Birthdays " +
+    "FOR EACH ROW EXECUTE FUNCTION SplitBirthdate()",
+    "UPDATE Birthdays SET Birthdate=Birthdate WHERE BirthMonth IS NULL OR BirthDay IS NULL",
+    "CREATE INDEX IF NOT EXISTS BirthdaysByDate ON Birthdays(GuildID, BirthMonth, BirthDay)",
+    "ALTER TABLE Guilds ADD COLUMN IF NOT EXISTS LastMessageID BIGINT",
+    "ALTER TABLE Guilds ADD COLUMN IF NOT EXISTS LastResult SMALLINT",
+]  # idempotent schema changes, applied in order at startup
+
+_pool: ThreadedConnectionPool | None = None
+_pool_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=DB_POOL_MAX, thread_name_prefix="db")
+
+
+def _get_pool() -> ThreadedConnectionPool:
+    """Get the connection pool, creating it on first use
 
     Returns:
-        typing.Optional[typing.Any]: returned values
+        ThreadedConnectionPool: process-wide connection pool
     """
-    con = psycopg2.connect(DATABASE_URL)
-    cur = con.cursor()
-    cur.execute(f'SELECT * FROM public.{table_name}')
-    val = cur.fetchall()
-    con.commit()
-    cur.close()
-    con.close()
-    return val
-
-
-def single_sql(
-    query: str,
-    values: tuple[typing.Any, ...] = (None,)
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                try:
+                    _pool = ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, DATABASE_URL)
+                except psycopg2.Error as err:
+                    logger.critical(f"Failed to connect to database: {err}")
+                    raise
+    return _pool
+
+
+def _run(
+    commands: list[tuple[str, tuple[typing.Any, ...] | None]],
+    returns: bool
 ) -> list[tuple[typing.Any, ...]]:
-    """
-    Opens a connection, submits a single SQL query to the database then cleans up
+    """Executes commands on a pooled connection as a single transaction. Blocking
 
     Args:
-        query (string): SQL query to execute.
-        values (tuple, optional):
-            Values to provide to the SQL query (i.e. for %s). Defaults to None.
+        commands (list[tuple[str, tuple[typing.Any, ...] | None]]): (query, values) pairs
+        returns (bool): If the result of the last command should be returned
 
     Raises:
         KeyViolation: Raised when key constraint is violated
+        RuntimeError: Raised on any other SQL error or warning, or if no connection can be had
 
     Returns:
-        (list): Values returned from sql query as a list of tuples.
+        list[tuple[typing.Any, ...]]: Values returned from the last query (empty if not returns)
     """
     try:
-        con = psycopg2.connect(DATABASE_URL)
-    except psycopg2.Error as err:
-        logger.critical(f"Failed to connect to database: {err}")
-    cur = con.cursor()
+        pool = _get_pool()
+        con = pool.getconn()
+    except psycopg2.Error as e:  # includes PoolError when every connection is in use
+        logger.error(f"Could not get a database connection: {e.__class__.__name__}: {e}")
+        raise RuntimeError(f"No database connection: {e.__class__.__name__}") from e
     err_mess = None
+    val: list[tuple[typing.Any, ...]] = []
     try:
-        cur.execute(query, values if values != (None,) else None)
+        with con.cursor() as cur:
+            for (query, values) in commands:
+                cur.execute(query, values)
+            if returns:
+                if cur.description:
+                    val = cur.fetchall()
+                else:
+                    err_mess = "Expected return values"
+        con.commit()
     except UniqueViolation as e:
+        con.rollback()
         raise KeyViolation("Key constraint violated") from e
     except psycopg2.Error as e:
         err_mess = f"SQL Error: {e.__class__.__name__}\n{traceback.format_exc()}"
         logger.error(err_mess)
+        if not con.closed:
+            con.rollback()
     except psycopg2.Warning as e:
         err_mess = f"SQL Warning: {e.__class__.__name__}\n{traceback.format_exc()}"
         logger.warning(err_mess)
+        con.rollback()
+    finally:
+        pool.putconn(con, close=bool(con.closed))
 
-    if cur.description:
-        val = cur.fetchall()
-
-    else:
-        err_mess = "Expected return values"
-    con.commit()
-    cur.close()
-    con.close()
     if err_mess:
         raise RuntimeError(err_mess)
     return val
 
 
-def single_void_SQL(query: str, values: tuple[typing.Any, ...] = (None,)) -> None:
+async def fetch(
+    query: str,
+    values: tuple[typing.Any, ...] | None = None
+) -> list[tuple[typing.Any, ...]]:
     """
-    Opens a connection, submits a single SQL query to the database then cleans up
+    Submits a single SQL query to the database on a pooled connection
 
     Args:
         query (string): SQL query to execute.
@@ -91,33 +135,32 @@ def single_void_SQL(query: str, values: tuple[typing.Any, ...] = (None,)) -> Non
 
     Raises:
         KeyViolation: Raised when key constraint is violated
+
+    Returns:
+        (list): Values returned from sql query as a list of tuples.
     """
-    try:
-        con = psycopg2.connect(DATABASE_URL)
-    except psycopg2.Error as err:
-        logger.critical(f"Failed to connect to database: {err}")
-    cur = con.cursor()
-    err_mess = None
-    try:
-        cur.execute(query, values if values != (None,) else None)
-    except UniqueViolation as e:
-        raise KeyViolation("Key constraint violated") from e
-    except psycopg2.Error as e:
-        err_mess = f"SQL Error: {e.__class__.__name__}\n{traceback.format_exc()}"
-        logger.error(err_mess)
-    except psycopg2.Warning as e:
-        err_mess = f"SQL Warning: {e.__class__.__name__}\n{traceback.format_exc()}"
-        logger.warning(err_mess)
+    return await asyncio.get_running_loop().run_in_executor(
+        _executor, _run, [(query, values)], True)
 
-    con.commit()
-    cur.close()
-    con.close()
-    if err_mess:
-        raise RuntimeError(err_mess)
+
+async def execute(query: str, values: tuple[typing.Any, ...] | None = None) -> None:
+    """
+    Submits a single SQL query with no return values to the database on a pooled connection
+
+    Args:
+        query (string): SQL query to execute.
+        values (tuple, optional):
+            Values to provide to the SQL query (i.e. for %s). Defaults to None.
+
+    Raises:
+        KeyViolation: Raised when key constraint is violated
+    """
+    await asyncio.get_running_loop().run_in_executor(
+        _executor, _run, [(query, values)], False)
 
 
-def multi_void_sql(commands: list[tuple[str, tuple[typing.Any, ...]]]) -> None:
-    """Executes multiple commands for the database that don't have a return
+async def transaction(commands: list[tuple[str, tuple[typing.Any, ...]]]) -> None:
+    """Executes multiple commands that don't have a return as a single transaction
 
     Args:
         commands (list[tuple[str, tuple[typing.Any, ...]]]):
@@ -126,32 +169,72 @@ def multi_void_sql(commands: list[tuple[str, tuple[typing.Any, ...]]]) -> None:
             the substituted values for the query.
 
     Raises:
-        KeyViolation: _description_
-        RuntimeError: _description_
+        KeyViolation: Raised when key constraint is violated
+        RuntimeError: Raised on any other SQL error or warning
+    """
+    await asyncio.get_running_loop().run_in_executor(
+        _executor, _run, list(commands), False)
+
+
+async def select_from_unsafe(table_name: str) -> list[tuple[typing.Any, ...]]:
+    """logs select from table. ONLY FOR TESTING
+
+    Args:
+        table_name (str): table to select from
+
+    Returns:
+        list[tuple[typing.Any, ...]]: returned values
+    """
+    return await fetch(f'SELECT * FROM public.{table_name}')
+
+
+def _warmup() -> None:
+    pool = _get_pool()
+    cons = [pool.getconn() for _ in range(DB_POOL_MIN)]
+    try:
+        for con in cons:
+            with con.cursor() as cur:
+                cur.execute("SELECT 1")
+            con.commit()
+    finally:
+        for con in cons:
+            pool.putconn(con, close=bool(con.closed))
+
+
+async def warmup() -> None:
+    """
+    Opens the minimum number of pooled connections and checks that each is alive
+    """
+    await asyncio.get_running_loop().run_in_executor(_executor, _warmup)
+    logger.info(f"Database pool warmed up ({DB_POOL_MIN}-{DB_POOL_MAX} connections)")
+
+
+def close() -> None:
     """
+    Closes all pooled connections
+    """
+    global _pool
+    _executor.shutdown(wait=True)
+    if _pool is not None:
+        _pool.closeall()
+        _pool = None
+
+
+def migrate() -> None:
+    """
+    Applies MIGRATIONS in a single transaction, so the schema is never left half updated
+    """
+    con = psycopg2.connect(DATABASE_URL)
     try:
-        con = psycopg2.connect(DATABASE_URL)
+        with con, con.cursor() as cur:
+            for migration in MIGRATIONS:
+                cur.execute(migration)
     except psycopg2.Error as err:
-        logger.critical(f"Failed to connect to database: {err}")
-    cur = con.cursor()
-    err_mess = None
-    for (query, values) in commands:
-        try:
-            cur.execute(query, values)
-        except UniqueViolation as e:
-            raise KeyViolation("Key constraint violated") from e
-        except psycopg2.Error as e:
-            err_mess = f"SQL Error: {e.__class__.__name__}\n{traceback.format_exc()}"
-            logger.error(err_mess)
-        except psycopg2.Warning as e:
-            err_mess = f"SQL Warning: {e.__class__.__name__}\n{traceback.format_exc()}"
-            logger.warning(err_mess)
-
-        if err_mess:
-            raise RuntimeError(err_mess)
-    con.commit()
-    cur.close()
-    con.close()
+        logger.critical(f"Database migration failed: {err}")
+        raise
+    finally:
+        con.close()
+    logger.info(f"Database schema up to date ({len(MIGRATIONS)} migrations checked)")
 
 
 def populate() -> None:
@@ -0,0 +1,177 @@
+import asyncio
+import typing
+from enum import Enum
+import discord
+
+from helpers.logger import Logger
+
+logger = Logger()
+
+ALL_CHANNELS = -1  # channel ID marking a feature as active in every channel of a guild
+
+
+class Feature(Enum):
+    """Message features that can be active in a channel"""
+    COUNTING = 0
+    ROLE_CHANNEL = 1
+    CHAIN = 2
+    TRIVIA = 3
+    MENTION = 4
+
+
+Handler = typing.Callable[[discord.Message], typing.Awaitable[None]]
+Loader = typing.Callable[[], typing.Awaitable[typing.Iterable[tuple[int, int]]]]
+
+TDispatcher = typing.TypeVar("TDispatcher", bound="MessageDispatcher")
+
+
+class MessageDispatcher(object):
+    """Single on_message listener that routes messages to the features active in their channel
+
+    Features register a handler, and optionally a loader returning the (guild ID, channel ID)
+    pairs where the feature is active. Messages in channels with no active feature (and that
+    do not mention Nix) are dropped without touching the database.
+    """
+    _instance = None
+
+    def __new__(cls: typing.Type[TDispatcher]) -> TDispatcher:
+        if cls._instance is None:
+            cls._instance = super(MessageDispatcher, cls).__new__(cls)
+            cls._instance._handlers = {}
+            cls._instance._loaders = {}
+            cls._instance._channels = {}
+            cls._instance._guild_wide = {}
+            cls._instance._channel_guild = {}
+            cls._instance.command_bot = None
+        return cls._instance
+
+    _handlers: dict[Feature, list[Handler]]
+    _loaders: dict[Feature, Loader]
+    _channels: dict[int, set[Feature]]
+    _guild_wide: dict[int, set[Feature]]
+    _channel_guild: dict[int, int]
+    command_bot: discord.Bot | None
+
+    def set_bot(self, discord_bot: discord.Bot) -> None:
+        """Set discord bot and attach the dispatcher as its on_message listener
+
+        Args:
+            discord_bot (discord.Bot): bot to set
+        """
+        self.command_bot = discord_bot
+        discord_bot.add_listener(self.on_message, "on_message")
+
+    def register(self, feature: Feature, handler: Handler, loader: Loader | None = None) -> None:
+        """Register a handler for a feature
+
+        Args:
+            feature (Feature): Feature the handler belongs to
+            handler (Handler): Called with each message in a channel where the feature is active
+            loader (Loader, optional): Returns the (guild ID, channel ID) pairs where the
+                feature is active. Defaults to None (entries are added with add())
+        """
+        self._handlers.setdefault(feature, []).append(handler)
+        if loader is not None:
+            self._loaders[feature] = loader
+
+    def add(self, feature: Feature, guild_id: int, channel_id: int) -> None:
+        """Mark a feature as active in a channel
+
+        Args:
+            feature (Feature): Feature to activate
+            guild_id (int): ID of the guild of the channel
+            channel_id (int): ID of the channel, or ALL_CHANNELS for the whole guild
+        """
+        if channel_id == ALL_CHANNELS:
+            self._guild_wide.setdefault(guild_id, set()).add(feature)
+        else:
+            self._channels.setdefault(channel_id, set()).add(feature)
+            self._channel_guild[channel_id] = guild_id
+
+    def remove(self, feature: Feature, channel_id: int) -> None:
+        """Mark a feature as inactive in a channel
+
+        Args:
+            feature (Feature): Feature to deactivate
+            channel_id (int): ID of the channel
+        """
+        features = self._channels.get(channel_id)
+        if features is not None:
+            features.discard(feature)
+            if not features:
+                self._forget_channel(channel_id)
+
+    async def refresh(self, feature: Feature) -> None:
+        """Rebuild the index entries of a feature from its loader
+
+        Args:
+            feature (Feature): Feature to rebuild
+        """
+        loader = self._loaders.get(feature)
+        if loader is None:
+            return
+        entries = await loader()
+        for channel_id in [chnl for chnl, features in self._channels.items()
+                           if feature in features]:
+            self.remove(feature, channel_id)
+        for guild_id in [guild for guild, features in self._guild_wide.items()
+                         if feature in features]:
+            self._guild_wide[guild_id].discard(feature)
+            if not self._guild_wide[guild_id]:
+                del self._guild_wide[guild_id]
+        for (guild_id, channel_id) in entries:
+            self.add(feature, guild_id, channel_id)
+
+    async def build(self) -> None:
+        """Rebuild the index for every feature with a loader"""
+        for feature in list(self._loaders):
+            await self.refresh(feature)
+        logger.info(f"Message routing index built for {len(self._channels)} channels")
+
+    def _forget_channel(self, channel_id: int) -> None:
+        self._channels.pop(channel_id, None)
+        self._channel_guild.pop(channel_id, None)
+
+    def forget_channel(self, channel_id: int) -> None:
+        """Drop all features of a channel (i.e. when it is deleted)
+
+        Args:
+            channel_id (int): ID of the channel
+        """
+        self._forget_channel(channel_id)
+
+    def forget_guild(self, guild_id: int) -> None:
+        """Drop all features of a guild (i.e. when Nix leaves it)
+
+        Args:
+            guild_id (int): ID of the guild
+        """
+        self._guild_wide.pop(guild_id, None)
+        for channel_id in [chnl for chnl, guild in self._channel_guild.items()
+                           if guild == guild_id]:
+            self._forget_channel(channel_id)
+
+    async def on_message(self, msg: discord.Message) -> None:
+        """Route a message to the handlers of the features active in its channel
+
+        Args:
+            msg (discord.Message): Message that triggered the event
+        """
+        features = self._channels.get(msg.channel.id)
+        if msg.guild is None or self.command_bot is None or self.command_bot.user is None:
+            return
+        if msg.author.id == self.command_bot.user.id:
+            return
+        if msg.guild.id in self._guild_wide:
+            features = (features or set()) | self._guild_wide[msg.guild.id]
+        if self.command_bot.user.mentioned_in(msg):
+            features = (features or set()) | {Feature.MENTION}
+        if not features:
+            return
+        handlers = [handler for feature in features for handler in self._handlers.get(feature, [])]
+        results = await asyncio.gather(*[handler(msg) for handler in handlers],
+                                       return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                logger.error(f"Message handler failed: {result.__class__.__name__}: {result}",
+                             guild_id=msg.guild.id, channel_id=msg.channel.id)
@@ -1,4 +1,5 @@
 from dotenv import load_dotenv
+import multiprocessing
 import os
 from helpers.logger import Logger
 if __debug__:
@@ -27,8 +28,13 @@ DATABASE_URL = load_env('DATABASE_URL')  # PostgreSQL db
 CAI_TOKEN = load_env('CAI_TOKEN')  # Character AI client token
 CAI_NIX_ID = load_env('CAI_NIX_ID')  # Character AI character ID of Nix bot
 DEBUG_GUILDS = os.getenv('DEBUG_GUILDS')  # Debug guilds (not required)
+DB_POOL_MIN = int(os.getenv('DB_POOL_MIN') or 1)  # Min pooled db connections (not required)
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX') or 10)  # Max pooled db connections (not required)
+LOG_FILE = os.getenv('LOG_FILE')  # Structured JSON log file (not required)
+MEDIA_CACHE_DIR = os.getenv('MEDIA_CACHE_DIR') or '/tmp/nix-media'  # Reddit media (not required)
 
-if __debug__:
+# worker processes (i.e. for downscaling media) import this too, but must not start a database
+if __debug__ and multiprocessing.current_process().name == "MainProcess":
     import testing.postgresql as tp  # type: ignore[import]
     postgres = tp.Postgresql()
     DATABASE_URL = postgres.url()
@@ -0,0 +1,140 @@
+import asyncio
+import datetime as dt
+import time
+import typing
+import discord
+
+from helpers.ledger import DeliveryLedger
+from helpers.logger import Logger
+from helpers.ratelimit import TokenBucket
+
+logger = Logger()
+
+CONCURRENCY = 8  # channels sent to at once
+GLOBAL_RATE = TokenBucket(50, 1 / 50)  # Discord allows 50 requests per second per bot
+
+Sender = typing.Callable[[discord.abc.Messageable], typing.Awaitable[None]]
+
+
+class Delivery:
+    """A message to send to one channel, for one day of a daily job
+
+    Args:
+        channel_id (int): ID of the channel to send to
+        day (dt.date): Local date the message is for
+        send (Sender): Makes the send once the channel is resolved
+        tag (str, optional): Tells apart several messages of a job to the same channel.
+            Defaults to ""
+    """
+
+    def __init__(self, channel_id: int, day: dt.date, send: Sender, tag: str = "") -> None:
+        self.channel_id = channel_id
+        self.day = day
+        self.send = send
+        self.tag = tag
+
+    @property
+    def key(self) -> tuple[dt.date, int, str]:
+        """Key of the delivery in the ledger"""
+        return (self.day, self.channel_id, self.tag)
+
+
+class FanoutReport:
+    """Outcome of a broadcast
+
+    Args:
+        job (str): Name of the broadcast
+    """
+
+    def __init__(self, job: str) -> None:
+        self.job = job
+        self.sent = 0
+        self.failed = 0
+        self.skipped = 0
+        self.duration = 0.0
+
+    def __str__(self) -> str:
+        return (f"{self.job}: sent {self.sent}, failed {self.failed}, " +
+                f"already sent {self.skipped} in {self.duration:.2f}s")
+
+
+async def _resolve(
+    bot: discord.Bot,
+    job: str,
+    channel_id: int
+) -> discord.abc.Messageable | None:
+    channel = bot.get_channel(channel_id)
+    if channel is None:
+        await GLOBAL_RATE.acquire()
+        channel = await bot.fetch_channel(channel_id)
+    if (not isinstance(channel, discord.abc.Messageable) or
+            isinstance(channel, discord.abc.PrivateChannel)):
+        logger.info(f"Channel for {job} not messageable",
+                    channel_id=channel_id)
+        return None
+    return channel
+
+
+async def broadcast(
+    bot: discord.Bot,
+    job: str,
+    deliveries: typing.Iterable[Delivery]
+) -> FanoutReport:
+    """Send to many channels concurrently without exceeding Discord's rate limits
+
+    Channels are resolved from the gateway cache where possible. Per-route limits are left to
+    the discord client, which queues requests to the same channel. Successful sends are recorded
+    in the job's DeliveryLedger, and deliveries already recorded are skipped, so a broadcast
+    interrupted by a restart only sends what is still missing when it is run again.
+
+    Args:
+        bot (discord.Bot): Bot to send with
+        job (str): Name of the job, used for the ledger and logging
+        deliveries (typing.Iterable[Delivery]): Messages to send
+
+    Returns:
+        FanoutReport: Number of successes and failures, and how long the broadcast took
+    """
+    report = FanoutReport(job)
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    start = time.monotonic()
+    ledger = DeliveryLedger(job)
+
+    deliveries = list(deliveries)
+    days = {delivery.day for delivery in deliveries}
+    done = await ledger.delivered(days) if days else set()
+    pending = [delivery for delivery in deliveries if delivery.key not in done]
+    report.skipped = len(deliveries) - len(pending)
+
+    async def deliver(delivery: Delivery) -> None:
+        async with semaphore:
+            try:
+                channel = await _resolve(bot, job, delivery.channel_id)
+                if channel is None:
+                    report.failed += 1
+                    return
+                await GLOBAL_RATE.acquire()
+                await delivery.send(channel)
+                ledger.record(delivery.key)
+                report.sent += 1
+            except discord.errors.Forbidden:
+                logger.info(f"Permission failure for {job}", channel_id=delivery.channel_id)
+                report.failed += 1
+            except discord.errors.HTTPException as e:
+                logger.warning(f"Failed to send {job}: {e.__class__.__name__}",
+                               channel_id=delivery.channel_id)
+                report.failed += 1
+            except Exception as e:  # one broken delivery must not stop the rest
+                logger.error(f"Failed to send {job}: {e.__class__.__name__}: {e}",
+                             channel_id=delivery.channel_id)
+                report.failed += 1
+
+    try:
+        await asyncio.gather(*[deliver(delivery) for delivery in pending])
+    finally:
+        await ledger.close()
+    if days:
+        await ledger.prune(max(days))
+    report.duration = time.monotonic() - start
+    logger.info(f"Broadcast {report}")
+    return report
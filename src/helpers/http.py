@@ -0,0 +1,25 @@
+import aiohttp
+
+_session: aiohttp.ClientSession | None = None
+
+
+def get_session() -> aiohttp.ClientSession:
+    """Get the process-wide HTTP session, creating it on first use
+
+    Must be called from within the running event loop
+
+    Returns:
+        aiohttp.ClientSession: Shared, connection pooling session
+    """
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+    return _session
+
+
+async def close_session() -> None:
+    """Close the process-wide HTTP session, if it was opened"""
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
@@ -0,0 +1,91 @@
+import asyncio
+import psycopg2
+import psycopg2.extensions
+from concurrent.futures import ThreadPoolExecutor
+
+from helpers.env import DATABASE_URL
+from helpers.logger import Logger
+
+logger = Logger()
+
+LEADER_LOCK = 0x4E6978  # advisory lock key held by the instance that runs scheduled jobs
+KEEPALIVE_IDLE = 10  # seconds before probing an idle lock connection
+KEEPALIVE_INTERVAL = 5  # seconds between probes, the connection is dropped after 3 misses
+CLOSE_TIMEOUT = 5  # seconds to wait for the lock connection to close on shutdown
+
+
+class LeaderLock:
+    """Elects one instance of Nix as leader with a Postgres session advisory lock
+
+    The lock is held on a dedicated connection, outside the pool, so it lives exactly as long
+    as that connection. If the leader dies or its connection drops, Postgres releases the lock
+    and the next instance to check takes over.
+    """
+
+    def __init__(self) -> None:
+        self._con: psycopg2.extensions.connection | None = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="leader")
+        self.is_leader = False
+
+    def _check(self) -> bool:
+        """Confirm the lock is still held, or try to take it. Blocking
+
+        Returns:
+            bool: If this instance holds the lock
+        """
+        held = self.is_leader
+        try:
+            if self._con is None or self._con.closed:
+                held = False  # a new connection never holds the lock
+                self._con = psycopg2.connect(
+                    DATABASE_URL, connect_timeout=10, keepalives=1,
+                    keepalives_idle=KEEPALIVE_IDLE, keepalives_interval=KEEPALIVE_INTERVAL,
+                    keepalives_count=3)
+                self._con.autocommit = True
+            with self._con.cursor() as cur:
+                if held:
+                    cur.execute("SELECT 1")
+                    return True
+                cur.execute("SELECT pg_try_advisory_lock(%s)", (LEADER_LOCK,))
+                row = cur.fetchone()
+                return row is not None and bool(row[0])
+        except psycopg2.Error as err:
+            logger.warning(f"Leader lock connection failed: {err.__class__.__name__}")
+            self._drop()
+            return False
+
+    def _drop(self) -> None:
+        if self._con is not None:
+            try:
+                self._con.close()
+            except psycopg2.Error:
+                pass
+        self._con = None
+
+    async def check(self) -> bool:
+        """Confirm this instance is still the leader, or try to become it
+
+        Returns:
+            bool: If this instance is the leader
+        """
+        leader = await asyncio.get_running_loop().run_in_executor(self._executor, self._check)
+        if leader != self.is_leader:
+            if leader:
+                logger.info("Became leader for scheduled jobs")
+            else:
+                logger.warning("Lost leadership for scheduled jobs")
+        self.is_leader = leader
+        return leader
+
+    async def close(self) -> None:
+        """Give up the lock by closing its connection, off the event loop
+
+        The connection is closed from a fresh thread, as the check thread may be stuck on it.
+        If it does not close in time, Postgres releases the lock once the keepalives fail
+        """
+        self.is_leader = False
+        try:
+            await asyncio.wait_for(asyncio.to_thread(self._drop), CLOSE_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("Leader lock connection did not close in time")
+        self._executor.shutdown(wait=False, cancel_futures=True)
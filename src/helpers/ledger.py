@@ -0,0 +1,97 @@
+import asyncio
+import datetime as dt
+
+import helpers.database as db
+from helpers.logger import Logger
+
+logger = Logger()
+
+LEDGER_BATCH = 50  # deliveries recorded per database write
+LEDGER_INTERVAL = 2.0  # seconds a recorded delivery may wait before being written
+LEDGER_DAYS = 3  # days of deliveries kept
+
+Key = tuple[dt.date, int, str]  # (day, channel ID, tag)
+
+
+class DeliveryLedger:
+    """Record of the messages a daily job has already delivered
+
+    Deliveries are buffered and written in batches, so a broadcast costs a handful of writes
+    rather than one per channel. A restarted run skips everything that was written; at most
+    the last unwritten batch is sent again.
+
+    Args:
+        job (str): Name of the job
+    """
+
+    def __init__(self, job: str) -> None:
+        self.job = job
+        self._buffer: list[Key] = []
+        self._flusher: asyncio.Task[None] | None = None
+        self._writes: set[asyncio.Task[None]] = set()
+
+    async def delivered(self, days: set[dt.date]) -> set[Key]:
+        """Get the deliveries already made on some days
+
+        Args:
+            days (set[dt.date]): Days to check
+
+        Returns:
+            set[Key]: (day, channel ID, tag) of each delivery made
+        """
+        return {(day, channel_id, tag) for (day, channel_id, tag) in await db.fetch(
+            "SELECT Day, ChannelID, Tag FROM Deliveries WHERE Job=%s AND Day = ANY(%s)",
+            (self.job, list(days)))}
+
+    def record(self, key: Key) -> None:
+        """Buffer a delivery to be written
+
+        Args:
+            key (Key): (day, channel ID, tag) of the delivery
+        """
+        self._buffer.append(key)
+        if len(self._buffer) >= LEDGER_BATCH:
+            self._write()
+        elif self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_later())
+
+    def _write(self) -> None:
+        """Start writing the buffer in a task that close waits for, rather than cancels"""
+        write = asyncio.create_task(self.flush())
+        self._writes.add(write)
+        write.add_done_callback(self._writes.discard)
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(LEDGER_INTERVAL)
+        self._write()
+
+    async def flush(self) -> None:
+        """Write all buffered deliveries"""
+        batch, self._buffer = self._buffer, []
+        if not batch:
+            return
+        (days, channels, tags) = zip(*batch)
+        try:
+            await db.execute(
+                "INSERT INTO Deliveries (Job, Day, ChannelID, Tag) " +
+                "SELECT %s, unnest(%s::date[]), unnest(%s::bigint[]), unnest(%s::text[]) " +
+                "ON CONFLICT DO NOTHING",
+                (self.job, list(days), list(channels), list(tags)))
+        except RuntimeError:
+            logger.error(f"Could not record {len(batch)} {self.job} deliveries")
+
+    async def close(self) -> None:
+        """Stop the timed flush, wait for writes already started and write anything left"""
+        if self._flusher is not None:
+            self._flusher.cancel()  # only ever cancels the wait, batches are left in the buffer
+        await asyncio.gather(*self._writes)
+        await self.flush()
+
+    async def prune(self, today: dt.date) -> None:
+        """Delete deliveries older than LEDGER_DAYS
+
+        Args:
+            today (dt.date): Latest day of the job
+        """
+        await db.execute("DELETE FROM Deliveries WHERE Job=%s AND Day<%s",
+                         (self.job, today - dt.timedelta(days=LEDGER_DAYS)))
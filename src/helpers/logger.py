@@ -1,6 +1,10 @@
 from enum import Enum
-from datetime import datetime
-import inspect
+from datetime import datetime, timezone
+from collections import deque
+import json
+import os
+import sys
+import threading
 import typing
 import discord
 
@@ -14,6 +18,72 @@ class Priority(Enum):
     CRITICAL = 4
 
 
+LOG_QUEUE_SIZE = 10000  # records held before the oldest are dropped
+LOG_BATCH_SIZE = 256  # records written per file write
+LOG_MAX_BYTES = 10 * 1024 * 1024  # size at which the log file is rotated
+LOG_BACKUPS = 5  # rotated log files to keep
+
+
+class LogWriter:
+    """Writes JSON log records to a file from a background thread
+
+    Records are put on a bounded queue, so logging never waits on disk. When the queue is
+    full the oldest record is dropped and counted. The file is rotated by size.
+
+    Args:
+        path (str): Path of the log file
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.dropped = 0
+        self._queue: deque[dict[str, typing.Any]] = deque(maxlen=LOG_QUEUE_SIZE)
+        self._wake = threading.Event()
+        self._closed = False
+        self._file = open(path, "a", encoding="utf-8")
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, record: dict[str, typing.Any]) -> None:
+        """Queue a record to be written
+
+        Args:
+            record (dict[str, typing.Any]): JSON serialisable record
+        """
+        if len(self._queue) == self._queue.maxlen:
+            self.dropped += 1
+        self._queue.append(record)
+        self._wake.set()
+
+    def _run(self) -> None:
+        while not self._closed or self._queue:
+            self._wake.wait(timeout=1)
+            self._wake.clear()
+            while self._queue:
+                batch: list[str] = []
+                while self._queue and len(batch) < LOG_BATCH_SIZE:
+                    batch.append(json.dumps(self._queue.popleft(), default=str))
+                self._write("\n".join(batch) + "\n")
+
+    def _write(self, text: str) -> None:
+        self._file.write(text)
+        self._file.flush()
+        if self._file.tell() >= LOG_MAX_BYTES:
+            self._file.close()
+            for index in range(LOG_BACKUPS - 1, 0, -1):
+                if os.path.exists(f"{self.path}.{index}"):
+                    os.replace(f"{self.path}.{index}", f"{self.path}.{index + 1}")
+            os.replace(self.path, f"{self.path}.1")
+            self._file = open(self.path, "a", encoding="utf-8")
+
+    def close(self) -> None:
+        """Write all queued records and stop the writer thread"""
+        self._closed = True
+        self._wake.set()
+        self._thread.join()
+        self._file.close()
+
+
 TLogger = typing.TypeVar("TLogger", bound="Logger")
 
 
@@ -26,6 +96,7 @@ class Logger(object):
             cls.print_level = 0
             cls.debug_mode = False
             cls.command_bot: discord.Bot | None = None
+            cls.writer: LogWriter | None = None
         return cls._instance
 
     def set_priority(self, priority: str) -> None:
@@ -46,6 +117,23 @@ class Logger(object):
         """
         self.command_bot = discord_bot
 
+    def set_output(self, path: str) -> None:
+        """Write structured (JSON) records to a file instead of printing them
+
+        Args:
+            path (str): Path of the log file
+        """
+        self.writer = LogWriter(path)
+        self.info(f"Writing structured logs to {path}")
+
+    def close(self) -> None:
+        """Flush and close the structured log file, if there is one"""
+        if self.writer is not None:
+            writer, self.writer = self.writer, None
+            if writer.dropped:
+                print(f"[WARNING] {{Logger}}: {writer.dropped} log records were dropped")
+            writer.close()
+
     def debug(
         self,
         message: typing.Any,
@@ -61,11 +149,7 @@ class Logger(object):
             member_id (int, optional): ID for member to log
             channel_id (int, optional): ID for channel to log
         """
-        try:
-            call_class = inspect.stack()[1][0].f_locals["self"].__class__.__name__
-        except KeyError:
-            call_class = "No class"
-        self._print_log(message, Priority.DEBUG, guild_id, member_id, channel_id, call_class)
+        self._log(message, Priority.DEBUG, guild_id, member_id, channel_id)
 
     def info(
         self,
@@ -82,11 +166,7 @@ class Logger(object):
             member_id (int, optional): ID for member to log
             channel_id (int, optional): ID for channel to log
         """
-        try:
-            call_class = inspect.stack()[1][0].f_locals["self"].__class__.__name__
-        except KeyError:
-            call_class = "No class"
-        self._print_log(message, Priority.INFO, guild_id, member_id, channel_id, call_class)
+        self._log(message, Priority.INFO, guild_id, member_id, channel_id)
 
     def warning(
         self,
@@ -103,11 +183,7 @@ class Logger(object):
             member_id (int, optional): ID for member to log
             channel_id (int, optional): ID for channel to log
         """
-        try:
-            call_class = inspect.stack()[1][0].f_locals["self"].__class__.__name__
-        except KeyError:
-            call_class = "No class"
-        self._print_log(message, Priority.WARNING, guild_id, member_id, channel_id, call_class)
+        self._log(message, Priority.WARNING, guild_id, member_id, channel_id)
 
     def error(
         self,
@@ -124,11 +200,7 @@ class Logger(object):
             member_id (int, optional): ID for member to log
             channel_id (int, optional): ID for channel to log
         """
-        try:
-            call_class = inspect.stack()[1][0].f_locals["self"].__class__.__name__
-        except KeyError:
-            call_class = "No class"
-        self._print_log(message, Priority.ERROR, guild_id, member_id, channel_id, call_class)
+        self._log(message, Priority.ERROR, guild_id, member_id, channel_id)
 
     def critical(
         self,
@@ -145,11 +217,23 @@ class Logger(object):
             member_id (int, optional): ID for member to log
             channel_id (int, optional): ID for channel to log
         """
-        try:
-            call_class = inspect.stack()[1][0].f_locals["self"].__class__.__name__
-        except KeyError:
-            call_class = "No class"
-        self._print_log(message, Priority.CRITICAL, guild_id, member_id, channel_id, call_class)
+        self._log(message, Priority.CRITICAL, guild_id, member_id, channel_id)
+
+    def _log(
+        self,
+        message: typing.Any,
+        priority: Priority,
+        guild_id: int,
+        member_id: int,
+        channel_id: int
+    ) -> None:
+        if priority.value < self.print_level:
+            return
+        # frame 0 is _log, frame 1 is the level method, frame 2 is the caller
+        caller = sys._getframe(2)
+        call_self = caller.f_locals.get("self") if "self" in caller.f_code.co_varnames else None
+        call_class = call_self.__class__.__name__ if call_self is not None else "No class"
+        self._print_log(message, priority, guild_id, member_id, channel_id, call_class)
 
     def _print_log(self,
                    message: str,
@@ -159,7 +243,17 @@ class Logger(object):
                    channel_id: int,
                    call_class: str
                    ) -> None:
-        if priority.value < self.print_level:
+        if self.writer is not None:
+            self.writer.put({
+                "timestamp": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+                "priority": priority.name,
+                "class": call_class,
+                "message": str(message),
+                "guild_id": guild_id or None,
+                "member_id": member_id or None,
+                "channel_id": channel_id or None,
+                "dropped": self.writer.dropped
+            })
             return
         log = "[" + priority.name + "] {" + call_class + "}: " + str(message)
         if Logger.debug_mode:
@@ -170,20 +264,13 @@ class Logger(object):
             return
         if guild_id:
             guild = self.command_bot.get_guild(guild_id)
-            if guild:
-                log += " (server: " + guild.name + ")"
-            else:
-                self.warning("Logger failed to deduce attribute (server) for following message:")
+            log += " (server: " + (guild.name if guild else f"unknown {guild_id}") + ")"
         if member_id:
             user = self.command_bot.get_user(member_id)
-            if user:
-                log += " (user: " + user.name + ")"
-            else:
-                self.warning("Logger failed to deduce attribute (user) for following message:")
+            log += " (user: " + (user.name if user else f"unknown {member_id}") + ")"
         if channel_id:
             channel = self.command_bot.get_channel(channel_id)
-            if channel and not isinstance(channel, discord.abc.PrivateChannel):
-                log += " (channel: " + channel.name + ")"
-            else:
-                self.warning("Logger failed to deduce attribute (channel) for following message:")
+            log += " (channel: " + (
+                channel.name if channel and not isinstance(channel, discord.abc.PrivateChannel)
+                else f"unknown {channel_id}") + ")"
         print(log)
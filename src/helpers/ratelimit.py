@@ -0,0 +1,30 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """Token bucket for spacing out requests that share a rate limit
+
+    Args:
+        size (int): Requests that may be sent in a burst
+        refill (float): Seconds to regain one request
+    """
+
+    def __init__(self, size: int, refill: float) -> None:
+        self.size = size
+        self.refill = refill
+        self.tokens = float(size)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Wait until a request may be sent"""
+        async with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.size, self.tokens + (now - self.updated) / self.refill)
+            self.updated = now
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) * self.refill)
+                self.tokens = 1
+                self.updated = time.monotonic()
+            self.tokens -= 1
@@ -0,0 +1,86 @@
+import time
+from collections import Counter, OrderedDict
+import discord
+
+from helpers.logger import Logger
+
+logger = Logger()
+
+MEMBER_TTL = 60  # seconds a member fetched over REST is reused for
+MEMBER_CACHE_SIZE = 1024
+
+
+class Resolver:
+    """Resolves guilds and members from the gateway cache, only using REST when it misses
+
+    Members fetched over REST are kept for a short time, so a burst of events for the same
+    member (i.e. removing several reactions) only costs one request.
+
+    Args:
+        bot (discord.Bot): Bot whose cache to read
+    """
+
+    def __init__(self, bot: discord.Bot) -> None:
+        self.bot = bot
+        self._members: OrderedDict[tuple[int, int], tuple[float, discord.Member]] = OrderedDict()
+        self.stats: Counter[str] = Counter()
+
+    @property
+    def rest_requests(self) -> int:
+        """Total number of REST requests made by this resolver"""
+        return self.stats["guild_rest"] + self.stats["member_rest"]
+
+    async def get_guild(self, guild_id: int) -> discord.Guild | None:
+        """Get a guild, from the gateway cache if possible
+
+        Args:
+            guild_id (int): ID of the guild
+
+        Returns:
+            discord.Guild | None: The guild, or None if it could not be found
+        """
+        guild = self.bot.get_guild(guild_id)
+        if guild is not None:
+            self.stats["guild_cache"] += 1
+            return guild
+        self.stats["guild_rest"] += 1
+        try:
+            return await self.bot.fetch_guild(guild_id)
+        except discord.errors.HTTPException as e:
+            logger.warning(f"Could not fetch guild: {e.__class__.__name__}", guild_id=guild_id)
+            return None
+
+    async def get_member(self, guild: discord.Guild, user_id: int) -> discord.Member | None:
+        """Get a member of a guild, from the gateway cache if possible
+
+        Args:
+            guild (discord.Guild): Guild of the member
+            user_id (int): ID of the user
+
+        Returns:
+            discord.Member | None: The member, or None if they could not be found
+        """
+        member = guild.get_member(user_id)
+        if member is not None:
+            self.stats["member_cache"] += 1
+            return member
+
+        key = (guild.id, user_id)
+        cached = self._members.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            self._members.move_to_end(key)
+            self.stats["member_ttl"] += 1
+            return cached[1]
+
+        self.stats["member_rest"] += 1
+        try:
+            member = await guild.fetch_member(user_id)
+        except discord.errors.HTTPException as e:
+            logger.warning(f"Could not fetch member: {e.__class__.__name__}",
+                           guild_id=guild.id)
+            return None
+        self._members[key] = (time.monotonic() + MEMBER_TTL, member)
+        self._members.move_to_end(key)
+        while len(self._members) > MEMBER_CACHE_SIZE:
+            self._members.popitem(last=False)
+        return member
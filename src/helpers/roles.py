@@ -0,0 +1,117 @@
+import asyncio
+import discord
+
+from helpers.logger import Logger
+from helpers.ratelimit import TokenBucket
+
+logger = Logger()
+
+COALESCE_WINDOW = 1.0  # seconds to gather role changes for a member before editing
+BUCKET_SIZE = 5  # member edits a guild may burst
+BUCKET_REFILL = 1.0  # seconds for a guild to regain one member edit
+APPLIED_LIMIT = 1024  # members whose last edit is remembered until the cache shows it
+
+
+class RoleQueue:
+    """Merges role changes for a member into a single member edit
+
+    Changes queued within COALESCE_WINDOW of the first one are applied together, the latest
+    change to a role wins, and no request is made if the member already has the final roles.
+    Each member has at most one edit in flight, and the roles to send are worked out only once
+    the edit may be sent, so edits never overwrite each other.
+    """
+
+    def __init__(self) -> None:
+        self._pending: dict[tuple[int, int], tuple[discord.Member, dict[int, bool]]] = {}
+        self._tasks: dict[tuple[int, int], asyncio.Task[None]] = {}
+        self._buckets: dict[int, TokenBucket] = {}
+        # (roles before, roles after) of recent edits the member cache may not show yet
+        self._applied: dict[tuple[int, int], tuple[frozenset[int], frozenset[int]]] = {}
+        self._draining = asyncio.Event()
+
+    def add(self, member: discord.Member, role: discord.Role) -> None:
+        """Queue a role to be given to a member
+
+        Args:
+            member (discord.Member): Member to give the role to
+            role (discord.Role): Role to give
+        """
+        self._queue(member, role, True)
+
+    def remove(self, member: discord.Member, role: discord.Role) -> None:
+        """Queue a role to be taken from a member
+
+        Args:
+            member (discord.Member): Member to take the role from
+            role (discord.Role): Role to take
+        """
+        self._queue(member, role, False)
+
+    def _queue(self, member: discord.Member, role: discord.Role, to_add: bool) -> None:
+        key = (member.guild.id, member.id)
+        entry = self._pending.get(key)
+        changes = entry[1] if entry else {}
+        changes[role.id] = to_add
+        self._pending[key] = (member, changes)
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.create_task(self._run(key))
+
+    async def _run(self, key: tuple[int, int]) -> None:
+        """Apply the queued changes of a member, one edit at a time, until none are left"""
+        try:
+            while key in self._pending:
+                if not self._draining.is_set():
+                    try:
+                        await asyncio.wait_for(self._draining.wait(), COALESCE_WINDOW)
+                    except asyncio.TimeoutError:
+                        pass
+                await self._apply(key)
+        except Exception as e:
+            self._pending.pop(key, None)
+            logger.error(f"Role assignment failed: {e.__class__.__name__}: {e}", guild_id=key[0])
+        finally:
+            self._tasks.pop(key, None)
+
+    async def _apply(self, key: tuple[int, int]) -> None:
+        entry = self._pending.pop(key, None)
+        if entry is None:
+            return
+        (member, changes) = entry
+        await self._buckets.setdefault(key[0], TokenBucket(BUCKET_SIZE, BUCKET_REFILL)).acquire()
+
+        member = member.guild.get_member(member.id) or member
+        current = frozenset(role.id for role in member.roles if not role.is_default())
+        base = current
+        applied = self._applied.pop(key, None)
+        if applied is not None and applied[0] == current:
+            # the gateway has not reported our last edit yet, so the cache shows the roles before
+            base = applied[1]
+            self._applied[key] = applied
+        target = {role_id: role for role_id in base
+                  if (role := member.guild.get_role(role_id)) is not None}
+        for role_id, to_add in changes.items():
+            role = member.guild.get_role(role_id)
+            if role is None:
+                logger.error("Couldnt get role for queued role change", guild_id=key[0])
+            elif to_add:
+                target[role_id] = role
+            else:
+                target.pop(role_id, None)
+        if target.keys() == base:
+            logger.debug("Skipping role edit that would change nothing", guild_id=key[0])
+            return
+
+        try:
+            await member.edit(roles=list(target.values()), reason="role assignment")
+            self._applied[key] = (current, frozenset(target))
+            while len(self._applied) > APPLIED_LIMIT:
+                del self._applied[next(iter(self._applied))]
+        except discord.errors.Forbidden:
+            logger.info("Permission failure for role assignment", guild_id=key[0])
+        except discord.errors.HTTPException as e:
+            logger.error(f"Role assignment failed: {e.__class__.__name__}", guild_id=key[0])
+
+    async def drain(self) -> None:
+        """Apply all queued changes immediately (i.e. before shutdown)"""
+        self._draining.set()
+        await asyncio.gather(*list(self._tasks.values()))
@@ -0,0 +1,158 @@
+import asyncio
+import datetime as dt
+import typing
+import zoneinfo
+from discord.ext import tasks
+
+import helpers.database as db
+from helpers.leader import LeaderLock
+from helpers.logger import Logger
+from helpers.style import TIME
+
+logger = Logger()
+
+TICK = 60  # seconds between checks for due jobs
+BUCKETS = 15  # guilds are spread over this many minutes around their delivery time
+DAY_MINUTES = 24 * 60
+DEFAULT_ZONE = "UTC"
+
+Job = typing.Callable[[dict[int, dt.date]], typing.Awaitable[None]]
+
+TScheduler = typing.TypeVar("TScheduler", bound="DailyScheduler")
+
+
+def get_zone(name: str) -> zoneinfo.ZoneInfo | None:
+    """Look up a time zone by its IANA name
+
+    Args:
+        name (str): Name of the time zone (i.e. Europe/London)
+
+    Returns:
+        zoneinfo.ZoneInfo | None: The time zone, or None if there is no such zone
+    """
+    try:
+        return zoneinfo.ZoneInfo(name)
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+def due_day(
+    guild_id: int,
+    delivery: int | None,
+    zone: str | None,
+    now: dt.datetime
+) -> dt.date:
+    """Get the local date of the latest delivery of a guild that is not in the future
+
+    Args:
+        guild_id (int): ID of the guild, which picks its bucket
+        delivery (int | None): Minutes after local midnight to deliver at, None for TIME
+        zone (str | None): Time zone of the guild, None for DEFAULT_ZONE
+        now (dt.datetime): Current (aware) time
+
+    Returns:
+        dt.date: Local date of the delivery
+    """
+    tzinfo = get_zone(zone or DEFAULT_ZONE) or zoneinfo.ZoneInfo(DEFAULT_ZONE)
+    local = now.astimezone(tzinfo)
+    if delivery is None:
+        delivery = TIME.hour * 60 + TIME.minute
+    minutes = delivery + guild_id % BUCKETS
+    if minutes >= DAY_MINUTES:
+        minutes = delivery - guild_id % BUCKETS  # spread late deliveries before, within the day
+    if local.hour * 60 + local.minute >= minutes:
+        return local.date()
+    return local.date() - dt.timedelta(days=1)
+
+
+class DailyScheduler(object):
+    """Runs daily jobs for each guild at the guild's chosen local time
+
+    The last run of every job for every guild is stored in JobRuns, so a restart neither
+    repeats nor skips a day, and a delivery missed while offline is made once on startup.
+    Guilds are spread over BUCKETS minutes by ID, so a delivery time does not fire as one burst.
+    A failed check is logged and retried on the next tick, so the loop never stops by itself.
+    When several instances of Nix are running, only the one holding the LeaderLock runs jobs.
+    """
+    _instance = None
+
+    def __new__(cls: typing.Type[TScheduler]) -> TScheduler:
+        if cls._instance is None:
+            cls._instance = super(DailyScheduler, cls).__new__(cls)
+            cls._instance._jobs = {}
+            cls._instance._running = {}
+            cls._instance._leader = LeaderLock()
+        return cls._instance
+
+    _jobs: dict[str, Job]
+    _running: dict[str, asyncio.Task[None]]
+    _leader: LeaderLock
+
+    def register(self, name: str, job: Job) -> None:
+        """Register a daily job
+
+        Args:
+            name (str): Unique name of the job, stored with its runs
+            job (Job): Called with the IDs of the guilds that are due, each with its local date
+        """
+        self._jobs[name] = job
+
+    def start(self) -> None:
+        """Start checking for due jobs, unless already started"""
+        if not self.tick.is_running():
+            self.tick.start()
+
+    async def stop(self) -> None:
+        """Stop checking for due jobs, and give up leadership"""
+        self.tick.cancel()
+        await self._leader.close()
+
+    @tasks.loop(seconds=TICK)
+    async def tick(self) -> None:
+        """Run every job that has guilds due, if this instance is the leader"""
+        try:
+            await self._tick()
+        except Exception as e:
+            logger.error(f"Scheduler tick failed: {e.__class__.__name__}: {e}")
+
+    async def _tick(self) -> None:
+        if not await self._leader.check():
+            for task in self._running.values():
+                task.cancel()  # another instance may already be running the job
+            return
+        now = dt.datetime.now(dt.timezone.utc)
+        guilds = await db.fetch("SELECT ID, DeliveryTime, TimeZone FROM Guilds")
+        last_runs = {(job, guild_id): last for (job, guild_id, last) in await db.fetch(
+            "SELECT Job, GuildID, LastRun FROM JobRuns")}
+        days = {guild_id: due_day(guild_id, delivery, zone, now)
+                for (guild_id, delivery, zone) in guilds}
+
+        for name in self._jobs:
+            if name in self._running:
+                continue
+            new = [guild_id for guild_id in days if (name, guild_id) not in last_runs]
+            if new:
+                # Guilds seen for the first time start from their latest delivery, rather
+                # than getting an extra one as soon as they join
+                await self._mark(name, {guild_id: days[guild_id] for guild_id in new})
+            due = {guild_id: day for guild_id, day in days.items()
+                   if (name, guild_id) in last_runs and last_runs[(name, guild_id)] < day}
+            if due:
+                self._running[name] = asyncio.create_task(self._run(name, due))
+
+    async def _run(self, name: str, due: dict[int, dt.date]) -> None:
+        logger.info(f"Running daily {name} for {len(due)} guilds")
+        try:
+            await self._jobs[name](due)
+            await self._mark(name, due)
+        except Exception as e:
+            logger.error(f"Daily {name} failed: {e.__class__.__name__}: {e}")
+        finally:
+            self._running.pop(name, None)
+
+    async def _mark(self, name: str, days: dict[int, dt.date]) -> None:
+        await db.execute(
+            "INSERT INTO JobRuns (Job, GuildID, LastRun) " +
+            "SELECT %s, unnest(%s::bigint[]), unnest(%s::date[]) ON CONFLICT (Job, GuildID) " +
+            "DO UPDATE SET LastRun=GREATEST(JobRuns.LastRun, EXCLUDED.LastRun)",
+            (name, list(days.keys()), list(days.values())))
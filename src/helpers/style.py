@@ -2,8 +2,7 @@ import datetime
 import discord
 from dataclasses import dataclass
 
-TIME = datetime.time(hour=7)
-RESET = datetime.time(hour=8)
+TIME = datetime.time(hour=7)  # default local time for daily messages
 
 
 @dataclass
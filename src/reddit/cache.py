@@ -0,0 +1,244 @@
+import asyncio
+import asyncprawcore as prawcore  # type: ignore[import]
+import time
+import typing
+from collections import Counter, OrderedDict
+
+from helpers.logger import Logger
+from reddit.client import get_reddit
+from reddit.index import PrefixIndex
+
+logger = Logger()
+
+LISTING_SIZE = 15  # posts fetched per listing page
+CACHE_BYTES = 4 * 1024 * 1024  # approximate memory cap for cached listings
+TTLS = {  # seconds a listing is reused for, per time filter
+    "hour": 5 * 60,
+    "day": 15 * 60,
+    "week": 60 * 60,
+    "month": 3 * 60 * 60,
+    "year": 6 * 60 * 60,
+    "all": 12 * 60 * 60,
+}
+RECORD_OVERHEAD = 200  # approximate bytes of a record besides its strings
+FOUND_TTL = 6 * 60 * 60  # seconds subreddit metadata is reused for
+MISSING_TTL = 10 * 60  # seconds a missing, banned or private subreddit is remembered for
+SUBREDDIT_CACHE_SIZE = 4096  # subreddits whose metadata is kept
+
+
+class PostRecord:
+    """The parts of a reddit submission needed to show it
+
+    Args:
+        title (str): Title of the post
+        subreddit (str): Display name of the subreddit of the post
+        text (str): Selfpost text, empty for link posts
+        url (str): Link url, empty for selfposts
+        over_18 (bool): If the post is marked NSFW
+    """
+    __slots__ = ("title", "subreddit", "text", "url", "over_18")
+
+    def __init__(self, title: str, subreddit: str, text: str, url: str, over_18: bool) -> None:
+        self.title = title
+        self.subreddit = subreddit
+        self.text = text
+        self.url = url
+        self.over_18 = over_18
+
+    @classmethod
+    def from_submission(cls, subm: typing.Any) -> 'PostRecord':
+        """Copy the needed parts of an asyncpraw submission
+
+        Args:
+            subm (asyncpraw.models.Submission): Submission to copy
+
+        Returns:
+            PostRecord: Compact record of the submission
+        """
+        return cls(subm.title, subm.subreddit.display_name,
+                   subm.selftext if subm.is_self else "",
+                   "" if subm.is_self else subm.url,
+                   bool(subm.over_18))
+
+    @property
+    def size(self) -> int:
+        """Approximate memory used by the record, in bytes"""
+        return RECORD_OVERHEAD + len(self.title) + len(self.text) + len(self.url)
+
+
+class Listing:
+    """A page of the top posts of a subreddit for a time filter
+
+    Args:
+        posts (list[PostRecord]): The posts, in listing order
+        after (str | None): Fullname of the last post, to continue from, or None if this is
+            the last page
+        ttl (float): Seconds the listing may be reused for
+    """
+    __slots__ = ("posts", "after", "expires", "size")
+
+    def __init__(self, posts: list[PostRecord], after: str | None, ttl: float) -> None:
+        self.posts = posts
+        self.after = after
+        self.expires = time.monotonic() + ttl
+        self.size = RECORD_OVERHEAD + sum(post.size for post in posts)
+
+
+class ListingCache:
+    """Process-wide cache of subreddit listing pages
+
+    Listings expire after the TTL of their time filter, and the least recently used ones are
+    evicted when the cache grows past CACHE_BYTES. Concurrent misses for the same listing share
+    a single fetch. Records are shared between readers, so they must not be modified.
+    """
+
+    def __init__(self) -> None:
+        self._listings: OrderedDict[tuple[str, str, str], Listing] = OrderedDict()
+        self._fetches: dict[tuple[str, str, str], asyncio.Task[Listing]] = {}
+        self._size = 0
+        self.stats: Counter[str] = Counter()
+
+    async def get(self, subreddit: str, time_filter: str, after: str = "") -> Listing:
+        """Get a page of the top posts of a subreddit, fetching it if it is not cached
+
+        Args:
+            subreddit (str): Subreddit name
+            time_filter (str): Time period of the top posts
+            after (str, optional): Fullname of the post to continue after. Defaults to ""
+                (the first page)
+
+        Raises:
+            prawcore.AsyncPrawcoreException: Raised if the listing could not be fetched
+
+        Returns:
+            Listing: The listing
+        """
+        key = (subreddit.lower(), time_filter, after)
+        listing = self._listings.get(key)
+        if listing is not None and listing.expires > time.monotonic():
+            self._listings.move_to_end(key)
+            self.stats["hit"] += 1
+            return listing
+
+        fetch = self._fetches.get(key)
+        if fetch is None:
+            self.stats["miss"] += 1
+            fetch = asyncio.create_task(self._fetch(subreddit, time_filter, after))
+            self._fetches[key] = fetch
+            fetch.add_done_callback(lambda _: self._fetches.pop(key, None))
+        else:
+            self.stats["shared"] += 1
+        listing = await asyncio.shield(fetch)
+        self._store(key, listing)
+        return listing
+
+    async def _fetch(self, subreddit_name: str, time_filter: str, after: str) -> Listing:
+        subreddit = await get_reddit().subreddit(subreddit_name)
+        submissions = [post async for post in subreddit.top(
+            time_filter=time_filter, limit=LISTING_SIZE, params={"after": after} if after else {})]
+        posts = [PostRecord.from_submission(post) for post in submissions]
+        logger.debug(f"Fetched {len(posts)} posts from r/{subreddit_name} ({time_filter})")
+        return Listing(posts,
+                       submissions[-1].fullname if len(submissions) == LISTING_SIZE else None,
+                       TTLS.get(time_filter, TTLS["day"]))
+
+    def _store(self, key: tuple[str, str, str], listing: Listing) -> None:
+        old = self._listings.pop(key, None)
+        if old is not None:
+            self._size -= old.size
+        self._listings[key] = listing
+        self._size += listing.size
+        while self._size > CACHE_BYTES and len(self._listings) > 1:
+            (_, evicted) = self._listings.popitem(last=False)
+            self._size -= evicted.size
+
+
+class SubredditInfo:
+    """What is known about a subreddit
+
+    Args:
+        name (str): Display name of the subreddit (as typed, if it was not found)
+        problem (str | None): "not found", "banned" or "private", or None if it can be read
+        over18 (bool): If the subreddit is marked NSFW
+    """
+    __slots__ = ("name", "problem", "over18", "expires")
+
+    def __init__(self, name: str, problem: str | None, over18: bool) -> None:
+        self.name = name
+        self.problem = problem
+        self.over18 = over18
+        self.expires = time.monotonic() + (MISSING_TTL if problem else FOUND_TTL)
+
+    @property
+    def exists(self) -> bool:
+        """If the subreddit exists and can be read"""
+        return self.problem is None
+
+
+class SubredditCache:
+    """Process-wide cache of subreddit metadata
+
+    Found subreddits are remembered for FOUND_TTL and missing ones for MISSING_TTL, so
+    repeated checks of popular subreddits and of typos make no requests. Other errors
+    (i.e. Reddit being down) are not cached. Concurrent misses share a single request.
+    The names of cached subreddits that exist are kept in a prefix index for autocomplete.
+    """
+
+    def __init__(self) -> None:
+        self._infos: OrderedDict[str, SubredditInfo] = OrderedDict()
+        self._fetches: dict[str, asyncio.Task[SubredditInfo]] = {}
+        self.names = PrefixIndex()
+        self.stats: Counter[str] = Counter()
+
+    async def get(self, subreddit: str) -> SubredditInfo:
+        """Get the metadata of a subreddit, fetching it if it is not cached
+
+        Args:
+            subreddit (str): Subreddit name
+
+        Raises:
+            prawcore.AsyncPrawcoreException: Raised if Reddit could not be asked
+
+        Returns:
+            SubredditInfo: The metadata
+        """
+        key = subreddit.lower()
+        info = self._infos.get(key)
+        if info is not None and info.expires > time.monotonic():
+            self._infos.move_to_end(key)
+            self.stats["hit"] += 1
+            return info
+
+        fetch = self._fetches.get(key)
+        if fetch is None:
+            self.stats["miss"] += 1
+            fetch = asyncio.create_task(self._fetch(subreddit))
+            self._fetches[key] = fetch
+            fetch.add_done_callback(lambda _: self._fetches.pop(key, None))
+        info = await asyncio.shield(fetch)
+        self._infos[key] = info
+        self._infos.move_to_end(key)
+        if info.exists:
+            self.names.add(info.name)
+        else:
+            self.names.discard(info.name)
+        while len(self._infos) > SUBREDDIT_CACHE_SIZE:
+            (_, evicted) = self._infos.popitem(last=False)
+            self.names.discard(evicted.name)
+        return info
+
+    async def _fetch(self, subreddit_name: str) -> SubredditInfo:
+        subreddit = await get_reddit().subreddit(subreddit_name)
+        try:
+            await subreddit.load()
+        except prawcore.exceptions.Redirect:
+            return SubredditInfo(subreddit_name, "not found", False)
+        except prawcore.exceptions.NotFound:
+            return SubredditInfo(subreddit_name, "banned", False)
+        except prawcore.exceptions.Forbidden:
+            return SubredditInfo(subreddit_name, "private", False)
+        return SubredditInfo(subreddit.display_name, None, bool(subreddit.over18))
+
+
+LISTINGS = ListingCache()  # shared by every RedditInterface
+SUBREDDITS = SubredditCache()  # shared by every RedditInterface and the daily job
@@ -0,0 +1,30 @@
+import asyncpraw as praw  # type: ignore[import]
+
+from helpers.env import CLIENT_ID, SECRET_KEY, USER_AGENT
+
+_reddit: praw.Reddit | None = None
+
+
+def get_reddit() -> praw.Reddit:
+    """Get the process-wide Reddit client, creating it on first use
+
+    The client keeps its own HTTP session and fetches a new OAuth token by itself when the
+    current one expires. Must be called from within the running event loop
+
+    Returns:
+        praw.Reddit: Shared, read-only Reddit client
+    """
+    global _reddit
+    if _reddit is None:
+        _reddit = praw.Reddit(client_id=CLIENT_ID,
+                              client_secret=SECRET_KEY,
+                              user_agent=USER_AGENT)
+    return _reddit
+
+
+async def close_reddit() -> None:
+    """Close the process-wide Reddit client, if it was opened"""
+    global _reddit
+    if _reddit is not None:
+        await _reddit.close()
+        _reddit = None
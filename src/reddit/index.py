@@ -0,0 +1,151 @@
+import bisect
+import typing
+
+import helpers.database as db
+from helpers.logger import Logger
+
+logger = Logger()
+
+AUTOCOMPLETE_LIMIT = 25  # most choices Discord shows for an autocompleted option
+
+
+class PrefixIndex:
+    """Set of names that can be searched by case-insensitive prefix
+
+    Names are kept in a sorted list, so a search is a binary search plus a scan of the matches
+
+    Args:
+        names (typing.Iterable[str], optional): Names to start with. Defaults to none
+    """
+
+    def __init__(self, names: typing.Iterable[str] = ()) -> None:
+        self._names = {name.lower(): name for name in names}
+        self._keys = sorted(self._names)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, name: str) -> bool:
+        return name.lower() in self._names
+
+    def add(self, name: str) -> None:
+        """Add a name, replacing the display form of a name that differs only in case
+
+        Args:
+            name (str): Name to add
+        """
+        key = name.lower()
+        if key not in self._names:
+            bisect.insort(self._keys, key)
+        self._names[key] = name
+
+    def discard(self, name: str) -> None:
+        """Remove a name, if present
+
+        Args:
+            name (str): Name to remove
+        """
+        key = name.lower()
+        if self._names.pop(key, None) is not None:
+            del self._keys[bisect.bisect_left(self._keys, key)]
+
+    def complete(self, prefix: str, limit: int = AUTOCOMPLETE_LIMIT) -> list[str]:
+        """Get the names starting with a prefix
+
+        Args:
+            prefix (str): Start of the name, in any case
+            limit (int, optional): Most names to return. Defaults to AUTOCOMPLETE_LIMIT
+
+        Returns:
+            list[str]: Matching names, in alphabetical order
+        """
+        key = prefix.lower()
+        found: list[str] = []
+        for i in range(bisect.bisect_left(self._keys, key), len(self._keys)):
+            if len(found) >= limit or not self._keys[i].startswith(key):
+                break
+            found.append(self._names[self._keys[i]])
+        return found
+
+
+class SubscriptionIndex:
+    """Each guild's subscribed subreddits, for autocomplete without database reads
+
+    Loaded once with restore, then kept up to date as guilds subscribe, unsubscribe, delete
+    channels or remove Nix
+    """
+
+    def __init__(self) -> None:
+        self._guilds: dict[int, PrefixIndex] = {}
+        self._channels: dict[int, dict[str, int]] = {}  # guild -> subreddit -> channel
+
+    async def restore(self) -> None:
+        """Load every guild's subscriptions from the database
+
+        The new index is built aside and swapped in whole, so the old one keeps answering
+        until the load is done
+        """
+        rows = await db.fetch("SELECT GuildID, Subreddit, SubredditChannelID FROM Subreddits")
+        loaded = SubscriptionIndex()
+        for (guild_id, subreddit, channel_id) in rows:
+            loaded.add(guild_id, subreddit, channel_id)
+        (self._guilds, self._channels) = (loaded._guilds, loaded._channels)
+        logger.debug(f"Indexed subscriptions of {len(self._guilds)} guilds")
+
+    def add(self, guild_id: int, subreddit: str, channel_id: int) -> None:
+        """Record a new subscription
+
+        Args:
+            guild_id (int): ID of the guild
+            subreddit (str): Subreddit subscribed to
+            channel_id (int): ID of the channel the daily posts go to
+        """
+        self._guilds.setdefault(guild_id, PrefixIndex()).add(subreddit)
+        self._channels.setdefault(guild_id, {})[subreddit.lower()] = channel_id
+
+    def discard(self, guild_id: int, subreddit: str) -> None:
+        """Record a removed subscription
+
+        Args:
+            guild_id (int): ID of the guild
+            subreddit (str): Subreddit unsubscribed from
+        """
+        if guild_id in self._guilds:
+            self._guilds[guild_id].discard(subreddit)
+            self._channels[guild_id].pop(subreddit.lower(), None)
+
+    def forget_guild(self, guild_id: int) -> None:
+        """Drop every subscription of a guild
+
+        Args:
+            guild_id (int): ID of the guild
+        """
+        self._guilds.pop(guild_id, None)
+        self._channels.pop(guild_id, None)
+
+    def forget_channel(self, guild_id: int, channel_id: int) -> None:
+        """Drop every subscription posting to a channel
+
+        Args:
+            guild_id (int): ID of the guild of the channel
+            channel_id (int): ID of the channel
+        """
+        for (subreddit, subscribed) in list(self._channels.get(guild_id, {}).items()):
+            if subscribed == channel_id:
+                self.discard(guild_id, subreddit)
+
+    def of(self, guild_id: int | None) -> PrefixIndex:
+        """Get the subscriptions of a guild
+
+        Args:
+            guild_id (int | None): ID of the guild, or None outside of guilds
+
+        Returns:
+            PrefixIndex: The guild's subscriptions (empty if it has none)
+        """
+        if guild_id is None:
+            return PrefixIndex()
+        return self._guilds.get(guild_id, PrefixIndex())
+
+
+SUBSCRIPTIONS = SubscriptionIndex()  # shared by the reddit cog and the guild/channel events
@@ -1,17 +1,18 @@
-import asyncpraw as praw  # type: ignore[import]
 import asyncprawcore as prawcore  # type: ignore[import]
+import asyncio
 import random
-import aiohttp
-import io
 import discord
 import re
 
 from helpers.style import Emotes
-from helpers.env import CLIENT_ID, SECRET_KEY, USER_AGENT
 from helpers.logger import Logger
+from reddit.cache import LISTINGS, SUBREDDITS, Listing, PostRecord
+import reddit.media as media
 
 logger = Logger()
 
+LOW_WATER = 5  # posts left in a viewer's buffer when the next page is fetched
+
 
 class Post:
     """Class representing a reddit post
@@ -25,17 +26,162 @@ class Post:
         self.text = text
         self._url = url
         self.img: list[discord.File] = []
+        self.transferred = 0
 
     async def load_img(self) -> 'Post':
-        """Load image from reddit post"""
+        """Load image from reddit post, through the on-disk media cache
+
+        Images too large to upload are downscaled, or linked if they are animated
+        """
         if self._url and re.search(r"\.(png|jpg|gif|jpeg)$", self._url):
-            async with aiohttp.ClientSession() as session:
-                async with session.get(self._url) as resp:
-                    self.img = [discord.File(io.BytesIO(await resp.read()), self._url)]
+            prepared = await media.prepare(self._url)
+            if prepared.path is not None:
+                self.img = [discord.File(prepared.path, prepared.filename)]
+            else:
+                self.text += self._url
+            self.transferred = prepared.downloaded + prepared.uploaded
+            logger.debug(f"Post media: downloaded {prepared.downloaded} bytes, " +
+                         f"uploading {prepared.uploaded} bytes")
         elif self._url:
             self.text += self._url
         return self
 
+    @classmethod
+    def from_record(cls, record: PostRecord) -> 'Post':
+        """Create a post (without its image loaded) from a cached record
+
+        Args:
+            record (PostRecord): Record of the post
+
+        Returns:
+            Post: The post
+        """
+        return cls("**" + record.title + "**\t*(r/" + record.subreddit + ")*\n" + record.text,
+                   record.url)
+
+
+def nsfw_response(subreddit_name: str) -> str:
+    """Message shown instead of posts from an NSFW subreddit in a channel not marked NSFW
+
+    Args:
+        subreddit_name (str): Subreddit name
+
+    Returns:
+        str: The message
+    """
+    logger.warning(f"Subreddit {subreddit_name} is marked NSFW")
+    return (f"{Emotes.GOON} Subreddit '{subreddit_name}' is marked NSFW. "
+            f"This channel is not marked NSFW {Emotes.GOON}")
+
+
+def describe_problem(subreddit_name: str, problem: str) -> str:
+    """Message shown instead of posts from a subreddit that is missing, banned or private
+
+    Args:
+        subreddit_name (str): Subreddit name
+        problem (str): "not found", "banned" or "private"
+
+    Returns:
+        str: The message
+    """
+    logger.warning(f"Requested subreddit {subreddit_name} is {problem}")
+    return f"{Emotes.WTF} Subreddit '{subreddit_name}' {problem}"
+
+
+def describe_error(subreddit_name: str, err: Exception) -> str:
+    """Message shown instead of posts when a subreddit could not be loaded
+
+    Args:
+        subreddit_name (str): Subreddit name
+        err (Exception): Error raised while loading the subreddit
+
+    Returns:
+        str: The message
+    """
+    if isinstance(err, prawcore.exceptions.Redirect):
+        return describe_problem(subreddit_name, "not found")
+    if isinstance(err, prawcore.exceptions.NotFound):
+        return describe_problem(subreddit_name, "banned")
+    if isinstance(err, prawcore.exceptions.Forbidden):
+        return describe_problem(subreddit_name, "private")
+    logger.error(f"Failure getting subreddit <{subreddit_name}>: {err.__class__.__name__}")
+    return f"{Emotes.WTF} Unknown error, please try again later"
+
+
+class DailyPosts:
+    """Hands out distinct posts from one listing to every channel subscribed to a subreddit
+
+    Posts are only reused once every post allowed in a channel has been handed out
+
+    Args:
+        subreddit_name (str): Subreddit name
+        listing (Listing | None): The listing, or None if it could not be loaded
+        error (str | None, optional): Message to send if the listing could not be loaded.
+            Defaults to None
+        over18 (bool, optional): If the subreddit is marked NSFW. Defaults to False
+    """
+
+    def __init__(
+        self,
+        subreddit_name: str,
+        listing: Listing | None,
+        error: str | None = None,
+        over18: bool = False
+    ) -> None:
+        self.subreddit_name = subreddit_name
+        self.listing = listing
+        self.error = error
+        self.over18 = over18
+        self._unused: list[PostRecord] = []
+
+    @classmethod
+    async def load(cls, subreddit_name: str) -> 'DailyPosts':
+        """Fetch today's top posts of a subreddit
+
+        Args:
+            subreddit_name (str): Subreddit name
+
+        Returns:
+            DailyPosts: Posts to hand out
+        """
+        try:
+            info = await SUBREDDITS.get(subreddit_name)
+            if not info.exists:
+                return cls(subreddit_name, None,
+                           describe_problem(subreddit_name, info.problem or ""))
+            return cls(subreddit_name, await LISTINGS.get(subreddit_name, "day"),
+                       over18=info.over18)
+        except prawcore.AsyncPrawcoreException as e:
+            return cls(subreddit_name, None, describe_error(subreddit_name, e))
+
+    def _take_unused(self, is_nsfw: bool) -> PostRecord | None:
+        for i in range(len(self._unused) - 1, -1, -1):
+            if is_nsfw or not self._unused[i].over_18:
+                return self._unused.pop(i)
+        return None
+
+    def take(self, is_nsfw: bool) -> Post:
+        """Take a post for a channel
+
+        Args:
+            is_nsfw (bool): If the channel is marked NSFW
+
+        Returns:
+            Post: A post not yet handed out, or a message explaining why there is none
+        """
+        if self.listing is None:
+            return Post(self.error or f"{Emotes.WTF} Unknown error, please try again later")
+        if self.over18 and not is_nsfw:
+            return Post(nsfw_response(self.subreddit_name))
+        record = self._take_unused(is_nsfw)
+        if record is None:
+            self._unused = random.sample(self.listing.posts, len(self.listing.posts))
+            record = self._take_unused(is_nsfw)
+        if record is None:
+            logger.warning(f"The subreddit {self.subreddit_name} ran out of posts")
+            return Post(f"Whoops, you ran out of posts! Try a different sub {Emotes.CONFUSED}")
+        return Post.from_record(record)
+
 
 class RedditInterface:
     """Interface for managing a reddit connection
@@ -47,16 +193,18 @@ class RedditInterface:
     """
 
     def __init__(self, sub: str, is_nsfw: bool = False, time: str = "day") -> None:
-        self.cache: list[praw.models.reddit.submission.Submission] = []
+        self.cache: list[PostRecord] = []
         self._nsub = sub
         self.time = time
         self.is_nsfw = is_nsfw
         self.sub: str | None = None
         self.error_response: str | None = None
+        self._after: str | None = None
+        self._next_page: asyncio.Task[None] | None = None
 
     @staticmethod
     async def valid_sub(subreddit: str) -> bool:
-        """If the given sub is resolvable
+        """If the given sub is resolvable, using the shared SUBREDDITS metadata cache
 
         Args:
             subreddit (str): Subreddit name
@@ -65,12 +213,7 @@ class RedditInterface:
             bool: returns True if the sub exists, and False otherwise
         """
         try:
-            async with praw.Reddit(client_id=CLIENT_ID,
-                                   client_secret=SECRET_KEY,
-                                   user_agent=USER_AGENT) as interface:
-                temp = await interface.subreddit(subreddit)
-                [post async for post in temp.top("day", 1)]
-            return True
+            return (await SUBREDDITS.get(subreddit)).exists
         except prawcore.exceptions.AsyncPrawcoreException:
             return False
 
@@ -89,64 +232,72 @@ class RedditInterface:
         post = await reddit.get_post()
         return post
 
-    async def set_subreddit(self, subreddit_name: str, num: int = 15) -> None:
+    async def set_subreddit(self, subreddit_name: str) -> None:
         """Sets interface to point to new subreddit
 
-        Using this also resets the number of cached reddit posts.
+        Using this also resets the cached reddit posts. Pages of the listing come from the
+        shared LISTINGS cache, this interface keeps its own shuffled copy of each.
 
         Args:
             subreddit (str): Subreddit name
-            num (int, optional): The number of reddit posts to cache. Defaults to 15.
-
-        Returns:
-            Post: _description_
         """
-        if not self.sub == subreddit_name:
-            try:
-                async with praw.Reddit(client_id=CLIENT_ID,
-                                       client_secret=SECRET_KEY,
-                                       user_agent=USER_AGENT) as instance:
-                    self.sub = subreddit_name
-                    subreddit = await instance.subreddit(self.sub)
-                    await subreddit.load()
-
-                    if subreddit.over18 and not self.is_nsfw:
-                        logger.warning(f"Subreddit {subreddit_name} is marked NSFW")
-                        self.error_response = (
-                            f"{Emotes.GOON} Subreddit '{subreddit_name}' is marked NSFW. "
-                            f"This channel is not marked NSFW {Emotes.GOON}"
-                        )
-                        return
-
-                    self.cache = [post async for post in subreddit.top(
-                        time_filter=self.time, limit=num) if self.is_nsfw or not post.over_18]
-                    logger.info(f"The subreddit {subreddit_name} was set for reddit.interface")
-                    self.error_response = None
-
-            except prawcore.exceptions.Redirect:
-                logger.warning(f"Requested subreddit {subreddit_name} was not found")
-                self.error_response = f"{Emotes.WTF} Subreddit '{subreddit_name}' not found"
-            except prawcore.exceptions.NotFound:
-                logger.warning(f"Requested subreddit {subreddit_name} is banned")
-                self.error_response = f"{Emotes.WTF} Subreddit '{subreddit_name}' banned"
-            except prawcore.exceptions.Forbidden:
-                logger.warning(f"Requested subreddit {subreddit_name} is set to private")
-                self.error_response = f"{Emotes.WTF} Subreddit '{subreddit_name}' private"
-            except prawcore.AsyncPrawcoreException as e:
-                logger.error(
-                    f"Failure getting subreddit <{subreddit_name}>: {e.__class__.__name__}"
-                )
-                self.error_response = f"{Emotes.WTF} Unknown error, please try again later"
-
-            random.shuffle(self.cache)
+        if self.sub == subreddit_name:
+            return
+        # Validate before touching any state, so a post requested meanwhile still comes from
+        # the old subreddit rather than the new one paged from the old cursor
+        listing: Listing | None = None
+        try:
+            info = await SUBREDDITS.get(subreddit_name)
+            if not info.exists:
+                error = describe_problem(subreddit_name, info.problem or "")
+            elif info.over18 and not self.is_nsfw:
+                error = nsfw_response(subreddit_name)
+            else:
+                listing = await LISTINGS.get(subreddit_name, self.time)
+                error = None
+        except prawcore.AsyncPrawcoreException as e:
+            error = describe_error(subreddit_name, e)
+
+        if self._next_page is not None:
+            self._next_page.cancel()
+            self._next_page = None
+        self.sub = subreddit_name
+        self.cache = []
+        self._after = None
+        self.error_response = error
+        if listing is not None:
+            self._add_page(listing)
+            logger.info(f"The subreddit {subreddit_name} was set for reddit.interface")
+
+    def _add_page(self, listing: Listing) -> None:
+        """Queue the posts of a page behind the posts already buffered"""
+        page = [post for post in listing.posts if self.is_nsfw or not post.over_18]
+        random.shuffle(page)
+        self.cache[:0] = page
+        self._after = listing.after
+
+    async def _fetch_next_page(self) -> None:
+        if self.sub is None:
+            return
+        # After the last page, start over from the first so the viewer never runs dry
+        sub = self.sub
+        try:
+            listing = await LISTINGS.get(sub, self.time, self._after or "")
+            if self.sub == sub:
+                self._add_page(listing)
+        except prawcore.AsyncPrawcoreException as e:
+            logger.warning(f"Could not fetch next page of r/{self.sub}: {e.__class__.__name__}")
+
+    def _prefetch(self) -> None:
+        """Fetch the next page in the background if the buffer is running low"""
+        if len(self.cache) < LOW_WATER and (self._next_page is None or self._next_page.done()):
+            self._next_page = asyncio.create_task(self._fetch_next_page())
 
     async def get_post(self) -> Post:
         """Gets a random reddit post from the cache
 
         Returns:
             Post: Random reddit post
-        Throws:
-            IndexError: If cache is empty
         """
 
         if not self.sub:
@@ -154,11 +305,13 @@ class RedditInterface:
         if self.error_response:
             logger.warning(f"Error while getting post: {self.error_response}")
             return Post(self.error_response)
+        self._prefetch()
+        if not self.cache and self._next_page is not None:
+            await asyncio.shield(self._next_page)
         try:
             subm = self.cache.pop()
         except IndexError:
             logger.warning(f"The subreddit {self.sub} ran out of posts")
             return Post(f"Whoops, you ran out of posts! Try a different sub {Emotes.CONFUSED}")
-        return await Post("**" + subm.title + "**\t*(r/" + subm.subreddit.display_name + ")*\n" +
-                          (subm.selftext if subm.is_self else ""),
-                          "" if subm.is_self else subm.url).load_img()
+        self._prefetch()
+        return await Post.from_record(subm).load_img()
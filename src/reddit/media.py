@@ -0,0 +1,299 @@
+import asyncio
+import aiofiles  # type: ignore[import]
+import aiohttp
+import hashlib
+import multiprocessing
+import os
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from PIL import Image  # type: ignore[import]
+
+from helpers.env import MEDIA_CACHE_DIR
+from helpers.http import get_session
+from helpers.logger import Logger
+
+logger = Logger()
+
+CACHE_BYTES = 256 * 1024 * 1024  # disk space the media cache may use
+MAX_DOWNLOAD = 25 * 1024 * 1024  # larger files are not downloaded
+UPLOAD_LIMIT = 8 * 1024 * 1024  # larger files are downscaled, or linked if animated
+MAX_DIMENSION = 2048  # pixels, longest side of a downscaled image
+CHUNK = 64 * 1024  # bytes read from the network at a time
+
+
+class MediaCache:
+    """Bounded on-disk cache of reddit media, keyed by the sha256 of the url
+
+    Files are streamed to disk, so a download never sits in memory whole, and are evicted
+    least recently used first once the cache holds more than CACHE_BYTES. Concurrent
+    downloads of the same url share one request. Directory scans, touches and removals run in
+    threads, off the event loop.
+
+    Args:
+        directory (str): Directory to keep the files in
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self._files: OrderedDict[str, int] | None = None
+        self._index_lock = asyncio.Lock()
+        self._size = 0
+        self._downloads: dict[str, asyncio.Task[str | None]] = {}
+        self.stats: Counter[str] = Counter()
+
+    def _scan(self) -> OrderedDict[str, int]:
+        """List the files already on disk with their sizes, oldest first. Blocking"""
+        os.makedirs(self.directory, exist_ok=True)
+        entries = sorted((entry for entry in os.scandir(self.directory)
+                          if entry.is_file() and not entry.name.endswith(".part")),
+                         key=lambda entry: entry.stat().st_mtime)
+        return OrderedDict((entry.name, entry.stat().st_size) for entry in entries)
+
+    async def _index(self) -> OrderedDict[str, int]:
+        """Load the files already on disk on first use"""
+        files = self._files
+        if files is None:
+            async with self._index_lock:
+                files = self._files
+                if files is None:
+                    files = await asyncio.to_thread(self._scan)
+                    self._size = sum(files.values())
+                    self._files = files
+        return files
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    @staticmethod
+    def _remove(paths: list[str]) -> None:
+        """Delete files that may already be gone. Blocking"""
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    async def lookup(self, name: str) -> str | None:
+        """Get the path of a cached file, marking it as recently used
+
+        Args:
+            name (str): Name of the file in the cache
+
+        Returns:
+            str | None: Path of the file, or None if it is not cached
+        """
+        files = await self._index()
+        if name not in files:
+            return None
+        files.move_to_end(name)
+        try:
+            await asyncio.to_thread(os.utime, self._path(name))  # keep the order across restarts
+        except FileNotFoundError:
+            files.pop(name, None)
+            return None
+        return self._path(name)
+
+    def size(self, name: str) -> int:
+        """Get the size of a cached file
+
+        Args:
+            name (str): Name of the file in the cache
+
+        Returns:
+            int: Size of the file in bytes, or 0 if it is not cached
+        """
+        return self._files.get(name, 0) if self._files is not None else 0
+
+    async def get(self, url: str, max_bytes: int = MAX_DOWNLOAD) -> tuple[str | None, bool]:
+        """Get the path of a cached copy of a url, downloading it if needed
+
+        Args:
+            url (str): Url of the media
+            max_bytes (int, optional): Size above which the download is abandoned.
+                Defaults to MAX_DOWNLOAD
+
+        Returns:
+            tuple[str | None, bool]: Path of the file (None if it could not be downloaded),
+                and if it was downloaded by this call
+        """
+        name = hashlib.sha256(url.encode()).hexdigest()
+        path = await self.lookup(name)
+        if path is not None:
+            self.stats["hit"] += 1
+            return (path, False)
+
+        download = self._downloads.get(name)
+        if download is not None:
+            return (await asyncio.shield(download), False)
+        self.stats["miss"] += 1
+        download = asyncio.create_task(self._download(url, name, max_bytes))
+        self._downloads[name] = download
+        download.add_done_callback(lambda _: self._downloads.pop(name, None))
+        return (await asyncio.shield(download), True)
+
+    async def _download(self, url: str, name: str, max_bytes: int) -> str | None:
+        partial = self._path(name + ".part")
+        size = 0
+        try:
+            async with get_session().get(url) as resp:
+                resp.raise_for_status()
+                if (resp.content_length or 0) > max_bytes:
+                    logger.info(f"Skipping {resp.content_length} byte media download")
+                    self.stats["too_large"] += 1
+                    return None
+                async with aiofiles.open(partial, "wb") as file:
+                    async for chunk in resp.content.iter_chunked(CHUNK):
+                        size += len(chunk)
+                        if size > max_bytes:
+                            logger.info(f"Media download passed {max_bytes} bytes, stopping")
+                            self.stats["too_large"] += 1
+                            self.stats["downloaded_bytes"] += size
+                            return None
+                        await file.write(chunk)
+            await asyncio.to_thread(os.replace, partial, self._path(name))
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+            logger.warning(f"Media download failed: {e.__class__.__name__}")
+            return None
+        finally:
+            await asyncio.to_thread(self._remove, [partial])
+        self.stats["downloaded_bytes"] += size
+        await self.store(name, size)
+        return self._path(name)
+
+    async def store(self, name: str, size: int) -> None:
+        """Add a file written to the cache directory, evicting old files if needed
+
+        Args:
+            name (str): Name of the file in the cache
+            size (int): Size of the file in bytes
+        """
+        files = await self._index()
+        self._size += size - files.pop(name, 0)
+        files[name] = size
+        evicted: list[str] = []
+        while self._size > CACHE_BYTES and len(files) > 1:
+            (old, old_size) = files.popitem(last=False)
+            self._size -= old_size
+            evicted.append(self._path(old))
+        if evicted:
+            await asyncio.to_thread(self._remove, evicted)
+
+
+MEDIA = MediaCache(MEDIA_CACHE_DIR)  # shared by every Post
+_processes: ProcessPoolExecutor | None = None
+
+
+class PreparedMedia:
+    """Media ready to be uploaded with a post
+
+    Args:
+        path (str | None): Path of the file to upload, or None to link the url instead
+        filename (str): Name to upload the file under
+        downloaded (int): Bytes downloaded to prepare it
+        uploaded (int, optional): Size of the file to upload. Defaults to 0
+    """
+
+    def __init__(self, path: str | None, filename: str, downloaded: int, uploaded: int = 0) -> None:
+        self.path = path
+        self.filename = filename
+        self.downloaded = downloaded
+        self.uploaded = uploaded if path is not None else 0
+
+
+def _downscale(source: str, target: str, max_bytes: int) -> int:
+    """Re-encode an image as a JPEG no larger than max_bytes, shrinking it as needed. Blocking
+
+    Runs in a worker process
+
+    Args:
+        source (str): Path of the image
+        target (str): Path to write the JPEG to
+        max_bytes (int): Largest allowed size of the JPEG
+
+    Returns:
+        int: Size of the JPEG, or 0 if it could not be made small enough
+    """
+    with Image.open(source) as image:
+        image = image.convert("RGB")
+        image.thumbnail((MAX_DIMENSION, MAX_DIMENSION))
+        while min(image.size) > 16:
+            image.save(target, "JPEG", quality=85, optimize=True)
+            size = os.path.getsize(target)
+            if size <= max_bytes:
+                return size
+            image = image.resize((image.width * 3 // 4, image.height * 3 // 4))
+    return 0
+
+
+async def prepare(url: str) -> PreparedMedia:
+    """Download media for upload, keeping it under UPLOAD_LIMIT
+
+    Oversized still images are downscaled in a worker process (and the result cached), while
+    oversized GIFs are not downloaded at all and should be linked instead
+
+    Args:
+        url (str): Url of the media
+
+    Returns:
+        PreparedMedia: File to upload (if any) and the bytes transferred
+    """
+    global _processes
+    animated = url.lower().endswith(".gif")
+    (path, fetched) = await MEDIA.get(url, UPLOAD_LIMIT if animated else MAX_DOWNLOAD)
+    size = await asyncio.to_thread(os.path.getsize, path) if path is not None else 0
+    downloaded = size if fetched else 0
+    if path is None or size <= UPLOAD_LIMIT:
+        if path is None:
+            MEDIA.stats["linked"] += 1
+        return PreparedMedia(path, filename(url), downloaded, size)
+
+    name = os.path.basename(path) + "-small"
+    small = await MEDIA.lookup(name)
+    small_size = MEDIA.size(name)
+    if small is None:
+        if _processes is None:
+            # spawned rather than forked, as forking a process that runs threads can leave
+            # the child stuck on a lock some thread held at the time
+            _processes = ProcessPoolExecutor(
+                max_workers=2, mp_context=multiprocessing.get_context("spawn"))
+        target = os.path.join(MEDIA.directory, name)
+        try:
+            size = await asyncio.get_running_loop().run_in_executor(
+                _processes, _downscale, path, target, UPLOAD_LIMIT)
+        except (OSError, ValueError, Image.DecompressionBombError) as e:  # unreadable image
+            logger.warning(f"Could not downscale media: {e.__class__.__name__}")
+            size = 0
+        except BrokenProcessPool:
+            logger.error("Downscaling worker died, restarting the worker processes")
+            shutdown()
+            size = 0
+        if not size:
+            await asyncio.to_thread(MEDIA._remove, [target])
+            MEDIA.stats["linked"] += 1
+            return PreparedMedia(None, filename(url), downloaded)
+        await MEDIA.store(name, size)
+        MEDIA.stats["downscaled"] += 1
+        (small, small_size) = (target, size)
+    return PreparedMedia(small, os.path.splitext(filename(url))[0] + ".jpg", downloaded,
+                         small_size)
+
+
+def shutdown() -> None:
+    """Stop the worker processes used for downscaling, if they were started"""
+    global _processes
+    if _processes is not None:
+        _processes.shutdown(wait=False, cancel_futures=True)
+        _processes = None
+
+
+def filename(url: str) -> str:
+    """Get the file name to upload a url's media under
+
+    Args:
+        url (str): Url of the media
+
+    Returns:
+        str: Last path segment of the url
+    """
+    return url.rsplit("/", 1)[-1].split("?", 1)[0] or "media"
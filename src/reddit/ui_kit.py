@@ -1,31 +1,76 @@
+import asyncio
 import discord
+from collections import Counter, deque
 from discord.partial_emoji import PartialEmoji
 
 from helpers.style import Emotes
 from helpers.emoji import string_to_partial_emoji
 from helpers.logger import Logger
-from reddit.interface import RedditInterface
+from reddit.interface import Post, RedditInterface
 logger = Logger()
 
+PREFETCH_DEPTH = 1  # posts loaded ahead (with their media) while the current one is shown
+PREFETCH_STATS: Counter[str] = Counter()  # "ready" if a prefetched post was loaded in time
+
 
 class PostViewer(discord.ui.View):
     """
     Manages the PostViewer context, which interactively displays reddit posts
 
+    The next posts are loaded in the background while the current one is on screen, so
+    "New Post" usually does not wait on an image download
+
     Args:
-        reddit (asyncpraw.Reddit): Reddit instance
+        reddit (RedditInterface): Reddit interface to get posts from
+        prefetch (int, optional): Number of posts to load ahead. Defaults to PREFETCH_DEPTH
     """
 
-    def __init__(self, reddit: RedditInterface):
+    def __init__(self, reddit: RedditInterface, prefetch: int = PREFETCH_DEPTH):
         super().__init__(timeout=300)
         self.reddit = reddit
+        self.prefetch = prefetch
+        self._upcoming: deque[asyncio.Task[Post]] = deque()
+        self._fill()
         logger.info("Created PostViewer")
 
+    def _fill(self) -> None:
+        while len(self._upcoming) < self.prefetch:
+            self._upcoming.append(asyncio.create_task(self.reddit.get_post()))
+
+    async def next_post(self) -> Post:
+        """Get the next post, from the prefetched ones if there are any
+
+        Returns:
+            Post: The post, with its media loaded
+        """
+        if not self._upcoming:
+            post = await self.reddit.get_post()
+        else:
+            upcoming = self._upcoming.popleft()
+            PREFETCH_STATS["ready" if upcoming.done() else "waited"] += 1
+            post = await upcoming
+        self._fill()
+        return post
+
+    def discard_prefetched(self) -> None:
+        """Drop prefetched posts and their media (i.e. when the subreddit changes)"""
+        while self._upcoming:
+            upcoming = self._upcoming.popleft()
+            if upcoming.done() and not upcoming.cancelled() and upcoming.exception() is None:
+                for file in upcoming.result().img:
+                    file.close()
+            else:
+                upcoming.cancel()
+
+    async def on_timeout(self) -> None:
+        self.discard_prefetched()
+        logger.debug("PostViewer timed out")
+
     @discord.ui.button(label="New Post", style=discord.ButtonStyle.primary,
                        emoji=string_to_partial_emoji(Emotes.YUM))
     async def refresh_callback(self, _: discord.Button, interaction: discord.Interaction) -> None:
         await interaction.response.defer()
-        post = await self.reddit.get_post()
+        post = await self.next_post()
         if interaction.message is None:
             logger.error("Interaction.message of reddit ui is None")
             return
@@ -66,8 +111,9 @@ class ChangeSubModal(discord.ui.Modal):
         if newsub is None:
             logger.error("InputText of reddit modal is None")
             return
+        self.caller.discard_prefetched()
         await self.caller.reddit.set_subreddit(newsub)
-        post = await self.caller.reddit.get_post()
+        post = await self.caller.next_post()
         if interaction.message is None:
             logger.error("Interaction.message of reddit ui is None")
             return